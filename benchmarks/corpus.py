@@ -0,0 +1,210 @@
+"""
+Deterministic synthetic corpora for the benchmarks
+
+Resumes and job descriptions are drawn from a Zipf-like vocabulary of resume terms, filler words, stopwords, digits
+and the odd tag, so every pipeline stage has realistic work to do. The same size and seed always give the same
+files, which are written once and reused.
+
+    python benchmarks/corpus.py --size medium
+"""
+import argparse
+import os
+import random
+import tempfile
+import zipfile
+
+SIZES = {'small': 100, 'medium': 10000, 'large': 100000}
+DEFAULT_SEED = 1
+
+TERMS = ("python java javascript sql linux cloud aws azure docker kubernetes network networking routing switching "
+         "security firewall cisco engineer engineering developer software hardware systems system data analysis "
+         "analytics machine learning management manager project program product customer customers support sales "
+         "marketing design designed develop developed developing lead leading led team teams experience "
+         "experienced communication skills skill requirements required responsibilities responsible architecture "
+         "infrastructure automation testing tested deployment operations service services enterprise solution "
+         "solutions technical technology technologies business strategy strategic stakeholder stakeholders "
+         "agile scrum release releases quality performance optimization scalable distributed database databases "
+         "api apis integration implemented implementation migration migrated monitoring troubleshooting "
+         "configuration wireless voice collaboration certification ccna ccnp degree bachelor master university "
+         "computer science").split()
+STOPWORDS = ("the and of to in a for with on as is at by an be this that from or are we you our will your it "
+             "have has which their was were").split()
+PUNCTUATION = [".", ",", ";", ":", "!", "?", " -", " (", ")", "/"]
+JOB_TITLES = ["Network Engineer", "Software Engineer", "Data Analyst", "Project Manager", "Sales Engineer",
+              "Systems Administrator", "Product Manager", "Security Analyst"]
+EMPLOYERS = ["Cisco", "Acme Corp", "Initech", "Globex", "Umbrella", "Hooli", "Vandelay Industries"]
+FIRST_NAMES = ["Jane", "John", "Ana", "Wei", "Priya", "Olu", "Marta", "Sam", "José", "Chloé"]
+LAST_NAMES = ["Doe", "Smith", "Garcia", "Chen", "Patel", "Okafor", "Nowak", "Müller", "Rossi", "Kim"]
+
+
+class TextGenerator(object):
+    """
+    Random documents from a fixed vocabulary, reproducible from the seed
+    """
+
+    def __init__(self, seed=DEFAULT_SEED, n_filler=5000):
+        self.rng = random.Random(seed)
+        filler_rng = random.Random(seed + 1)
+        letters = "abcdefghiklmnoprstuvwy"
+        filler = ["".join(filler_rng.choice(letters) for _ in range(filler_rng.randint(3, 10)))
+                  for _ in range(n_filler)]
+        # Common terms and stopwords first so the Zipf weights favour them
+        self.vocabulary = STOPWORDS + TERMS + filler
+        self.weights = [1.0 / rank for rank in range(1, len(self.vocabulary) + 1)]
+
+    def sentence(self):
+        words = self.rng.choices(self.vocabulary, self.weights, k=self.rng.randint(6, 24))
+        if self.rng.random() < 0.2:
+            words[self.rng.randrange(len(words))] = str(self.rng.randint(1, 2020))
+        if self.rng.random() < 0.1:
+            words.insert(self.rng.randrange(len(words)), self.rng.choice(PUNCTUATION))
+        sentence = " ".join(words)
+        return sentence[0].upper() + sentence[1:] + "."
+
+    def document(self, min_sentences=5, max_sentences=40):
+        return " ".join(self.sentence() for _ in range(self.rng.randint(min_sentences, max_sentences)))
+
+    def quickview_html(self):
+        paragraphs = ["<p>{}</p>".format(self.document(1, 6)) for _ in range(self.rng.randint(2, 8))]
+        return ('<!DOCTYPE html><html><head><meta charset="utf-8"><title>Quick View</title></head><body>'
+                '<div class="row"><label class="field firstName">First Name</label>{first}</div>'
+                '<div class="row lastName">Last Name{last}</div>'
+                '<div class="row jobTitle">Job title{title}</div>'
+                '<div class="row employer">Current employer{employer}</div>'
+                '<div class="value attachment">\n\n{resume}\n\n</div>'
+                '</body></html>').format(first=self.rng.choice(FIRST_NAMES), last=self.rng.choice(LAST_NAMES),
+                                         title=self.rng.choice(JOB_TITLES), employer=self.rng.choice(EMPLOYERS),
+                                         resume="\n".join(paragraphs))
+
+    def job_description_html(self):
+        sections = []
+        for header in ("What You'll Do", "Who You'll Work With", "Who You Are"):
+            items = "".join("<li>{}</li>".format(self.sentence()) for _ in range(self.rng.randint(3, 10)))
+            sections.append("<p><b>{}</b></p><p>{}</p><ul>{}</ul>".format(header, self.document(1, 4), items))
+        sections.append("<p><b>Why Cisco</b></p><p>{}</p>".format(self.document(2, 4)))
+        return ('<html><head><title>Job</title></head><body><nav>Jobs</nav>'
+                '<div class="job_description">{}</div><footer>{}</footer></body></html>').format(
+            "".join(sections), self.sentence())
+
+    def wiki_article_html(self, n_paragraphs=100):
+        """
+        A saved Wikipedia article: an infobox, navboxes, nested tables and references around the body's paragraphs
+        and lists, plus page chrome outside the body
+        """
+        body = ['<table class="infobox"><tbody><tr><th>{}</th></tr><tr><td><p>{}</p></td></tr></tbody></table>'.format(
+            self.rng.choice(JOB_TITLES), self.sentence())]
+        for i in range(n_paragraphs):
+            if i % 10 == 0:
+                body.append('<h2><span class="mw-headline">{}</span><span class="mw-editsection">[edit]</span></h2>'
+                            .format(self.rng.choice(TERMS).title()))
+            body.append('<p>{} <a href="/wiki/{term}">{term}</a><sup class="reference"><a href="#cite_note-{i}">'
+                        '[{i}]</a></sup> {}<br/>&amp; {}</p>'.format(self.sentence(), self.document(1, 6),
+                                                                     self.sentence(), term=self.rng.choice(TERMS), i=i))
+            if i % 7 == 3:
+                items = "".join('<li>{}<ul><li>{}</li></ul></li>'.format(self.sentence(), self.sentence())
+                                for _ in range(self.rng.randint(2, 6)))
+                body.append('<ul>{}</ul>'.format(items))
+            if i % 13 == 5:
+                rows = "".join("<tr><td>{}</td><td><table><tr><td><p>{}</p></td></tr></table></td></tr>".format(
+                    self.rng.choice(TERMS), self.sentence()) for _ in range(self.rng.randint(3, 8)))
+                body.append('<table class="wikitable">{}</table>'.format(rows))
+        refs = "".join('<li id="cite_note-{}">{}</li>'.format(i, self.sentence()) for i in range(n_paragraphs))
+        body.append('<div class="reflist"><ol class="references">{}</ol></div>'.format(refs))
+        body.append('<div role="navigation" class="navbox"><table><tr><td><ul>{}</ul></td></tr></table></div>'.format(
+            "".join("<li>{}</li>".format(term) for term in TERMS)))
+        body.append('<!-- NewPP limit report <p>not text</p> -->')
+        return ('<!DOCTYPE html><html><head><meta charset="UTF-8"><title>Article</title><script>var p = "<p>";'
+                '</script></head><body><div id="mw-navigation"><ul><li>Main page</li></ul></div>'
+                '<div id="content"><h1>Article</h1><div id="bodyContent"><div id="mw-content-text" lang="en">'
+                '<div class="mw-content-ltr mw-parser-output" lang="en" dir="ltr">{}</div></div></div></div>'
+                '<div id="footer"><p>Text is available under the Creative Commons license.</p></div>'
+                '</body></html>').format("".join(body))
+
+
+def data_dir(base=None):
+    return base or os.path.join(tempfile.gettempdir(), 'wordscan-bench')
+
+
+def _build(path, write):
+    # Written to a temporary name first so an interrupted run never leaves a truncated corpus to be reused
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = path + '.partial'
+        write(partial)
+        os.replace(partial, path)
+    return path
+
+
+def text_corpus(n_docs, seed=DEFAULT_SEED, base=None):
+    """
+    :return: path of a text file with one document per line, the format batch.py reads from stdin
+    """
+    def write(path):
+        generator = TextGenerator(seed)
+        with open(path, 'w', encoding='utf-8') as f:
+            for _ in range(n_docs):
+                f.write(generator.document() + "\n")
+
+    return _build(os.path.join(data_dir(base), 'text-{}-{}.txt'.format(n_docs, seed)), write)
+
+
+def quickview_zip(n_docs, seed=DEFAULT_SEED, base=None):
+    """
+    :return: path of an Avature Quick View export with n_docs profiles
+    """
+    def write(path):
+        generator = TextGenerator(seed)
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            for i in range(n_docs):
+                zip_file.writestr('profile{:06d}.html'.format(i), generator.quickview_html().encode('utf-8'))
+
+    return _build(os.path.join(data_dir(base), 'quickview-{}-{}.zip'.format(n_docs, seed)), write)
+
+
+def job_descriptions(n_docs, seed=DEFAULT_SEED, base=None):
+    """
+    :return: path of a directory of job description pages, as served by CISCO_JOBS_URL
+    """
+    def write(path):
+        generator = TextGenerator(seed)
+        os.makedirs(path)
+        for i in range(n_docs):
+            with open(os.path.join(path, 'jd{:06d}.html'.format(i)), 'w', encoding='utf-8') as f:
+                f.write(generator.job_description_html())
+
+    return _build(os.path.join(data_dir(base), 'jd-{}-{}'.format(n_docs, seed)), write)
+
+
+def wiki_articles(n_docs, seed=DEFAULT_SEED, base=None):
+    """
+    :return: path of a directory of saved Wikipedia articles, one per 100 documents, each about as much text
+    """
+    def write(path):
+        generator = TextGenerator(seed)
+        os.makedirs(path)
+        for i in range(max(1, n_docs // 100)):
+            with open(os.path.join(path, 'article{:05d}.html'.format(i)), 'w', encoding='utf-8') as f:
+                f.write(generator.wiki_article_html())
+
+    return _build(os.path.join(data_dir(base), 'wiki-{}-{}'.format(n_docs, seed)), write)
+
+
+def read_lines(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            yield line.rstrip('\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', choices=sorted(SIZES), default='small')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--data-dir', help="where corpora are written, default a wordscan-bench temporary directory")
+    args = parser.parse_args(argv)
+    n_docs = SIZES[args.size]
+    for build in (text_corpus, quickview_zip, job_descriptions, wiki_articles):
+        print(build(n_docs, args.seed, args.data_dir))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,350 @@
+"""
+Throughput and peak memory of each wordscan pipeline stage and mode on a synthetic corpus
+
+Runs offline against the deterministic corpora from corpus.py. Results can be saved as a named baseline in
+benchmarks/baselines and later runs compared against it, exiting non-zero when a stage got slower or hungrier than
+--tolerance allows.
+
+    python benchmarks/pipeline.py --size small
+    python benchmarks/pipeline.py --size medium --save master
+    python benchmarks/pipeline.py --size medium --compare master --stage tokenize --stage mode_words
+
+Peak memory is traced in this process only, so it leaves out cleaning workers. Stages whose dependencies, models
+or NLTK data are not installed are reported as skipped. Any other exception is reported as an error and fails the
+run, and a stage that has a baseline but is now skipped fails the comparison.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import corpus
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+WORDSCANNER_DIR = os.path.join(BENCHMARKS_DIR, os.pardir, 'wordscanner')
+BASELINES_DIR = os.path.join(BENCHMARKS_DIR, 'baselines')
+sys.path.insert(0, WORDSCANNER_DIR)
+
+from app_config import Config  # noqa: E402
+
+
+class Corpus(object):
+    """
+    Paths of the generated inputs for one size, built on first use
+    """
+
+    def __init__(self, n_docs, seed, base=None):
+        self.n_docs = n_docs
+        self.seed = seed
+        self.base = base
+
+    @property
+    def text_path(self):
+        return corpus.text_corpus(self.n_docs, self.seed, self.base)
+
+    @property
+    def zip_path(self):
+        return corpus.quickview_zip(self.n_docs, self.seed, self.base)
+
+    @property
+    def jd_dir(self):
+        return corpus.job_descriptions(self.n_docs, self.seed, self.base)
+
+    @property
+    def wiki_dir(self):
+        return corpus.wiki_articles(self.n_docs, self.seed, self.base)
+
+    def texts(self):
+        return corpus.read_lines(self.text_path)
+
+    def input_bytes(self, kind):
+        if kind in ('jd', 'wiki'):
+            path = self.jd_dir if kind == 'jd' else self.wiki_dir
+            return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+        return os.path.getsize(self.zip_path if kind == 'zip' else self.text_path)
+
+
+def stage_tokenize(data):
+    from components.preprocessing import TOKENIZER
+    for text in data.texts():
+        TOKENIZER.tokenize(text)
+
+
+def stage_preprocess(data):
+    from components.preprocessing import preprocess_documents
+    for _ in preprocess_documents(data.texts()):
+        pass
+
+
+def stage_preprocess_lemma(data):
+    from components.preprocessing import preprocess_documents
+    for _ in preprocess_documents(data.texts(), lemma=True):
+        pass
+
+
+def stage_preprocess_phrases(data):
+    from components.preprocessing import WordCleanerMixin
+    for _ in WordCleanerMixin(stem=False, lemma=False, phrases=True).clean_many(data.texts()):
+        pass
+
+
+def stage_count_exact(data):
+    from components.parallel import count_documents
+    from components.preprocessing import WordCleanerMixin
+    count_documents(WordCleanerMixin(stem=False, lemma=False), data.texts(), backend='exact').top(100)
+
+
+def stage_count_approximate(data):
+    from components.parallel import count_documents
+    from components.preprocessing import WordCleanerMixin
+    count_documents(WordCleanerMixin(stem=False, lemma=False), data.texts(), backend='approximate').top(100)
+
+
+def stage_count_sharded(data):
+    from components.parallel import count_documents
+    from components.preprocessing import WordCleanerMixin
+    count_documents(WordCleanerMixin(stem=False, lemma=False), data.texts(), backend='sharded').top(100)
+
+
+def stage_dedup(data):
+    from components.dedup import find_duplicates
+    find_duplicates(data.texts())
+
+
+def stage_quickview(data):
+    from components.avature import extract_quickview
+    extract_quickview(data.zip_path)
+
+
+def stage_parse_req(data):
+    from components.avature import _parse_req
+    for fname in sorted(os.listdir(data.jd_dir)):
+        with open(os.path.join(data.jd_dir, fname), 'rb') as f:
+            _parse_req(f.read())
+
+
+def stage_wiki_extract(data):
+    from components.wikiscraper import iter_wiki_texts
+    for _ in iter_wiki_texts([data.wiki_dir]):
+        pass
+
+
+def stage_mode_words(data):
+    from wordscan import WordCounts
+    WordCounts(multiple=True, stem=False, lemma=False, phrases=False, text=data.texts()).results()
+
+
+def stage_mode_keywords(data):
+    from wordscan import KeywordSearch
+    KeywordSearch(multiple=True, text=data.texts()).results(100)
+
+
+def stage_mode_skills(data):
+    from wordscan import SkillSearch
+    SkillSearch(multiple=True, text=data.texts()).results()
+
+
+def stage_mode_tfidf(data):
+    from wordscan import TfidfWordCounts
+    TfidfWordCounts(multiple=True, stem=False, lemma=True, phrases=True, text=data.texts()).results()
+
+
+def stage_mode_wiki(data):
+    from wordscan import WikiWordCounts
+    WikiWordCounts(stem=False, lemma=False, phrases=False, url=[data.wiki_dir]).results()
+
+
+def stage_mode_avature(data):
+    from wordscan import AvatureWordCounts
+    AvatureWordCounts(stem=False, lemma=False, phrases=False, zip_path=data.zip_path, sort_by='count').results()
+
+
+# Stage name -> (function, input it reads)
+STAGES = {'tokenize': (stage_tokenize, 'text'),
+          'preprocess': (stage_preprocess, 'text'),
+          'preprocess_lemma': (stage_preprocess_lemma, 'text'),
+          'preprocess_phrases': (stage_preprocess_phrases, 'text'),
+          'count_exact': (stage_count_exact, 'text'),
+          'count_approximate': (stage_count_approximate, 'text'),
+          'count_sharded': (stage_count_sharded, 'text'),
+          'dedup': (stage_dedup, 'text'),
+          'quickview': (stage_quickview, 'zip'),
+          'parse_req': (stage_parse_req, 'jd'),
+          'wiki_extract': (stage_wiki_extract, 'wiki'),
+          'mode_words': (stage_mode_words, 'text'),
+          'mode_keywords': (stage_mode_keywords, 'text'),
+          'mode_skills': (stage_mode_skills, 'text'),
+          'mode_tfidf': (stage_mode_tfidf, 'text'),
+          'mode_avature': (stage_mode_avature, 'zip'),
+          'mode_wiki': (stage_mode_wiki, 'wiki')}
+
+
+def measure(func, data, repeat=1, memory=True):
+    """
+    :return: (best wall seconds of repeat runs, peak traced MB or None)
+    """
+    seconds = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func(data)
+        seconds.append(time.perf_counter() - start)
+    peak_mb = None
+    if memory:
+        # A separate run, tracing slows everything down too much to time at the same time
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func(data)
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+    return min(seconds), peak_mb
+
+
+def _reason(e):
+    # NLTK frames its messages in lines of asterisks
+    return "{}: {}".format(type(e).__name__, next((line.strip() for line in str(e).splitlines() if line.strip('* ')),
+                                                  ''))
+
+
+def run_stages(names, data, repeat=1, memory=True):
+    """
+    :return: dict of stage name -> result dict, with a 'skipped' reason for stages missing a dependency, model file
+    or NLTK data, and an 'error' for stages that failed otherwise
+    """
+    results = {}
+    for name in names:
+        func, kind = STAGES[name]
+        try:
+            data.input_bytes(kind)  # Generate the input outside the timed region
+            seconds, peak_mb = measure(func, data, repeat, memory)
+        except (ImportError, LookupError, FileNotFoundError) as e:
+            results[name] = {'skipped': _reason(e)}
+            continue
+        except Exception as e:
+            results[name] = {'error': _reason(e)}
+            continue
+        results[name] = {'seconds': seconds,
+                         'docs_per_sec': data.n_docs / seconds if seconds else None,
+                         'mb_per_sec': data.input_bytes(kind) / 2 ** 20 / seconds if seconds else None,
+                         'peak_mb': peak_mb}
+    return results
+
+
+def report(results):
+    print("{:<20} {:>10} {:>12} {:>10} {:>10}".format('stage', 'seconds', 'docs/s', 'MB/s', 'peak MB'))
+    for name, result in results.items():
+        if 'skipped' in result or 'error' in result:
+            print("{:<20} {}, {}".format(name, 'skipped' if 'skipped' in result else 'ERROR',
+                                         result.get('skipped') or result.get('error')))
+            continue
+        peak = "{:.1f}".format(result['peak_mb']) if result['peak_mb'] is not None else '-'
+        print("{:<20} {:>10.3f} {:>12.1f} {:>10.2f} {:>10}".format(name, result['seconds'], result['docs_per_sec'],
+                                                                     result['mb_per_sec'], peak))
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARKS_DIR, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def baseline_path(name):
+    return os.path.join(BASELINES_DIR, '{}.json'.format(name))
+
+
+def save_baseline(name, size, seed, results):
+    os.makedirs(BASELINES_DIR, exist_ok=True)
+    baseline = {'size': size, 'seed': seed, 'commit': _git_commit(), 'python': platform.python_version(),
+                'platform': platform.platform(), 'stages': results}
+    with open(baseline_path(name), 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(baseline, results, tolerance):
+    """
+    Prints the change of each stage against baseline
+    :return: stage names that lost more than tolerance of their throughput or grew their peak memory by as much, or
+    that were measured in the baseline but are now skipped or fail
+    """
+    regressions = []
+    print("{:<20} {:>12} {:>12} {:>9} {:>10}".format('stage', 'base docs/s', 'docs/s', 'speed', 'memory'))
+    for name, result in results.items():
+        old = baseline['stages'].get(name)
+        if not old or 'skipped' in old or 'error' in old:
+            continue
+        if 'skipped' in result or 'error' in result:
+            regressions.append(name)
+            print("{:<20} {:>12.1f} {:>12} {:>9} {:>10}  {}".format(
+                name, old['docs_per_sec'], '-', '-', '-', 'NOW SKIPPED' if 'skipped' in result else 'NOW FAILING'))
+            continue
+        speed = result['docs_per_sec'] / old['docs_per_sec']
+        memory = None
+        if result['peak_mb'] is not None and old.get('peak_mb'):
+            memory = result['peak_mb'] / old['peak_mb']
+        regressed = speed < 1 - tolerance or (memory is not None and memory > 1 + tolerance)
+        if regressed:
+            regressions.append(name)
+        print("{:<20} {:>12.1f} {:>12.1f} {:>8.0%} {:>10}{}".format(
+            name, old['docs_per_sec'], result['docs_per_sec'], speed - 1,
+            "{:+.0%}".format(memory - 1) if memory is not None else '-', "  REGRESSION" if regressed else ""))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', choices=sorted(corpus.SIZES, key=corpus.SIZES.get), default='small',
+                        help="documents: " + ", ".join("{} {}".format(k, v) for k, v in corpus.SIZES.items()))
+    parser.add_argument('--seed', type=int, default=corpus.DEFAULT_SEED)
+    parser.add_argument('--stage', action='append', choices=sorted(STAGES), help="stage to run, default all")
+    parser.add_argument('--repeat', type=int, default=1, help="timed runs per stage, the fastest is kept")
+    parser.add_argument('--no-memory', action='store_true', help="skip the traced run measuring peak memory")
+    parser.add_argument('--data-dir', help="where corpora are generated, default a wordscan-bench temporary directory")
+    parser.add_argument('--save', metavar='NAME', help="store the results as baselines/NAME.json")
+    parser.add_argument('--compare', metavar='NAME', help="compare against baselines/NAME.json")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="share of throughput that may be lost, or peak memory gained, before failing")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(baseline_path(args.compare)) as f:
+            baseline = json.load(f)
+        if baseline['size'] != args.size or baseline['seed'] != args.seed:
+            parser.error("baseline {} was measured with --size {} --seed {}".format(
+                args.compare, baseline['size'], baseline['seed']))
+
+    Config.TOKEN_CACHE_ENABLED = False  # Every run must do the cleaning work it measures
+    data = Corpus(corpus.SIZES[args.size], args.seed, args.data_dir)
+    results = run_stages(args.stage or list(STAGES), data, args.repeat, memory=not args.no_memory)
+    print("{} documents ({}), seed {}".format(data.n_docs, args.size, args.seed))
+    report(results)
+
+    errors = [name for name, result in results.items() if 'error' in result]
+    if args.save and not errors:
+        save_baseline(args.save, args.size, args.seed, results)
+        print("Saved {}".format(baseline_path(args.save)))
+    status = 0
+    if baseline is not None:
+        print()
+        regressions = compare(baseline, results, args.tolerance)
+        if regressions:
+            print("Regressed beyond {:.0%}: {}".format(args.tolerance, ", ".join(regressions)))
+            status = 1
+    if errors:
+        print("Failed: {}{}".format(", ".join(errors), ", no baseline saved" if args.save else ""))
+        status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
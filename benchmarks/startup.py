@@ -0,0 +1,70 @@
+"""
+Import-time budget for wordscan startup
+
+Runs `python -X importtime` on the entry modules in a fresh interpreter and reports the cumulative import cost of
+each module they pull in. Exits non-zero when the total exceeds --budget, so slow imports creeping back in fail CI.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --module batch --top 30 --budget 0.5
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+WORDSCANNER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'wordscanner')
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def measure_imports(module, python=sys.executable):
+    """
+    :return: (wall seconds, list of (module, self seconds, cumulative seconds, depth))
+    """
+    start = time.perf_counter()
+    proc = subprocess.run([python, '-X', 'importtime', '-c', 'import {}'.format(module)], cwd=WORDSCANNER_DIR,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError("Importing {} failed:\n{}".format(module, proc.stderr))
+    imports = []
+    for line in proc.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports.append((name, int(self_us) / 1e6, int(cumulative_us) / 1e6, (len(indent) - 1) // 2))
+    return wall, imports
+
+
+def report(module, wall, imports, top):
+    total = sum(self_s for _, self_s, _, _ in imports)
+    print("{}: {:.3f}s imports, {:.3f}s interpreter wall time".format(module, total, wall))
+    print("{:>10} {:>10}  module".format('cumulative', 'self'))
+    for name, self_s, cumulative_s, depth in sorted(imports, key=lambda i: i[2], reverse=True)[:top]:
+        print("{:>9.1f}ms {:>9.1f}ms  {}{}".format(cumulative_s * 1000, self_s * 1000, '  ' * depth, name))
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--module', action='append', help="entry module to import, default wordscan and batch")
+    parser.add_argument('--top', type=int, default=15, help="modules listed per entry module")
+    parser.add_argument('--budget', type=float, default=1.0, help="seconds of import time allowed per entry module")
+    args = parser.parse_args(argv)
+
+    over_budget = []
+    for module in args.module or ['wordscan', 'batch']:
+        wall, imports = measure_imports(module)
+        total = report(module, wall, imports, args.top)
+        if total > args.budget:
+            over_budget.append(module)
+        print()
+    if over_budget:
+        print("Over the {:.2f}s budget: {}".format(args.budget, ", ".join(over_budget)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
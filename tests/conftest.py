@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The app and the benchmarks import their modules from these directories, as when run as scripts
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+sys.path.insert(0, os.path.join(ROOT, 'wordscanner'))
+
+
+@pytest.fixture
+def stopwords(monkeypatch):
+    """
+    STOPWORDS, falling back to its built-in words when NLTK or its stopword list is not installed
+    """
+    from components.preprocessing import STOPWORDS
+    try:
+        STOPWORDS.load()
+    except (ImportError, LookupError):
+        monkeypatch.setattr(STOPWORDS, '_words', STOPWORDS.base_words)
+    return STOPWORDS
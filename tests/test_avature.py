@@ -0,0 +1,63 @@
+import re
+import zipfile
+
+import pytest
+
+import corpus
+from components.avature import extract_quickview, iter_quickview_people
+
+bs4 = pytest.importorskip('bs4')
+pytest.importorskip('pandas')
+
+COLUMNS = ['fname', 'lname', 'title', 'emp', 'Resume']
+EDGE_CASES = {
+    'bom.html': b'\xef\xbb\xbf<html><body><div class="row firstName">First NameJos\xc3\xa9</div>'
+                b'<div class="value attachment">\n \n\nCaf\xc3\xa9 manager\n\n</div></body></html>',
+    'missing.html': b'<html><body><div class="row lastName">Last NameDoe</div><p>No resume</p></body></html>',
+    'duplicates.html': b'<html><body><div class="row firstName">First NameAnn</div>'
+                       b'<div class="row firstName">First NameBob</div>'
+                       b'<div class="firstName lastName">First NameCy</div>'
+                       b'<div class="row jobTitle">Job titleJob titleLead</div>'
+                       b'<div class="attachment value">Wrong order</div>'
+                       b'<div class="x"><span class="value attachment">Nested\n\n\n resume</span></div>'
+                       b'<div class="value attachment">Second resume</div></body></html>',
+    'empty.html': b'',
+}
+
+
+def _baseline_people(zip_path):
+    # Extraction as it was before the single pass: a find_all per field over the full parse, cleaned row by row
+    patterns = [('fname', "firstName"), ('lname', "lastName"), ('title', "jobTitle"), ('emp', "employer"),
+                ('Resume', "value attachment")]
+    labels = {'fname': 'First Name', 'lname': 'Last Name', 'title': 'Job title', 'emp': 'Current employer'}
+    people = []
+    with zipfile.ZipFile(zip_path) as zip_file:
+        for member in zip_file.infolist():
+            soup = bs4.BeautifulSoup(zip_file.read(member), 'html.parser')
+            person = {}
+            for column, pattern in patterns:
+                found = soup.find_all(class_=re.compile(pattern))
+                person[column] = found[0].get_text() if found else ''
+            for column, label in labels.items():
+                parts = person[column].split(label)
+                person[column] = parts[1] if len(parts) == 2 else ''
+            person['Resume'] = re.sub('((\\n) ?){2,}', '\n', person['Resume'])
+            people.append(person)
+    return people
+
+
+@pytest.fixture(scope='module')
+def quickview_zip(tmp_path_factory):
+    path = corpus.quickview_zip(40, base=str(tmp_path_factory.mktemp('corpus')))
+    with zipfile.ZipFile(path, 'a') as zip_file:
+        for name, raw in EDGE_CASES.items():
+            zip_file.writestr(name, raw)
+    return path
+
+
+def test_extraction_matches_find_all_per_field(quickview_zip):
+    expected = _baseline_people(quickview_zip)
+    assert [person['fname'] for person in expected[-4:]] == ['José', '', 'Ann', '']
+    df = extract_quickview(quickview_zip, extract=False)
+    assert df[COLUMNS].to_dict('records') == expected
+    assert list(iter_quickview_people(quickview_zip, extract=False)) == expected
@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from components.parallel import CleaningExecutor
+from components.preprocessing import WordCleanerMixin
+from components.shards import SHARD_SUFFIX
+
+pytest.importorskip('numpy')
+
+DOCS = ["Python developer with Python and SQL", "SQL analyst, Excel and SQL reports", "Java developer",
+        "Python data pipelines", "Excel dashboards for sales", "Java and Python services"] * 5
+
+
+def test_workers_spill_to_the_executors_shard_dir(stopwords, tmp_path):
+    cleaner = WordCleanerMixin(stem=False, lemma=False, phrases=False)
+    exact = CleaningExecutor(cleaner, workers=1, backend='exact').count(DOCS)
+    sharded = CleaningExecutor(cleaner, workers=2, chunk_size=4, backend='sharded', shard_dir=str(tmp_path),
+                               memory_bytes=1).count(DOCS)
+    # A one byte budget spills after every document, so each worker's shards land in tmp_path and are kept
+    assert len([f for f in os.listdir(str(tmp_path)) if f.endswith(SHARD_SUFFIX)]) == len(DOCS)
+    assert sorted(sharded.top()) == sorted(exact.top())
+
+
+def test_short_streams_are_cleaned_without_a_pool(stopwords, monkeypatch):
+    from components import parallel
+
+    def no_pool(*args, **kwargs):
+        raise AssertionError("started a pool for input that fits in one chunk")
+
+    monkeypatch.setattr(parallel.multiprocessing, 'Pool', no_pool)
+    cleaner = WordCleanerMixin(stem=False, lemma=False, phrases=False)
+    executor = CleaningExecutor(cleaner, workers=4, chunk_size=len(DOCS), backend='exact')
+    assert executor.count(iter(DOCS)).top() == CleaningExecutor(cleaner, workers=1).count(DOCS).top()
+    assert list(executor.clean(doc for doc in DOCS[:1])) == [cleaner.clean(DOCS[0])]
+
+
+def test_long_streams_keep_every_document(stopwords):
+    cleaner = WordCleanerMixin(stem=False, lemma=False, phrases=False)
+    executor = CleaningExecutor(cleaner, workers=2, chunk_size=len(DOCS) - 1)
+    assert list(executor.clean(iter(DOCS))) == list(cleaner.clean_many(DOCS))
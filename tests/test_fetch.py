@@ -0,0 +1,95 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import pytest
+
+from app_config import Config
+from components.cisco_jobs import fetch_reqs
+from components.avature import PageFetchException
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # The timed out client hangs up before the slow response is written
+
+
+class JobsHandler(BaseHTTPRequestHandler):
+    """
+    /jobs/<req ID> serves a job page. Req IDs starting with 'flaky' fail with 503 twice first, 'down' always fails,
+    'slow' answers after the client's timeout and 'empty' has no job description.
+    """
+
+    hits = {}
+    lock = threading.Lock()
+
+    def do_GET(self):
+        req_id = self.path.rsplit('/', 1)[-1]
+        with self.lock:
+            hits = self.hits[req_id] = self.hits.get(req_id, 0) + 1
+        if req_id.startswith('down') or (req_id.startswith('flaky') and hits <= 2):
+            return self._send(503, "unavailable")
+        if req_id.startswith('slow'):
+            time.sleep(0.5)
+        if req_id.startswith('empty'):
+            return self._send(200, "<html><body>No job here</body></html>")
+        self._send(200, '<html><body><div class="job_description"><p>Role {} engineer</p></div></body></html>'.format(
+            req_id))
+
+    def _send(self, status, body):
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def jobs_url(monkeypatch):
+    pytest.importorskip('requests')
+    pytest.importorskip('bs4')
+    JobsHandler.hits = {}
+    server = _Server(('127.0.0.1', 0), JobsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(Config, 'CISCO_JOBS_URL', 'http://127.0.0.1:{}/jobs/{{}}'.format(server.server_address[1]))
+    monkeypatch.setattr(Config, 'HTTP_CACHE_ENABLED', False)
+    yield Config.CISCO_JOBS_URL
+    server.shutdown()
+    server.server_close()
+
+
+def test_results_keep_input_order(jobs_url):
+    req_ids = ['r{}'.format(i) for i in range(20)]
+    results = fetch_reqs(req_ids, max_workers=8, retries=0, backoff=0)
+    assert [req_id for req_id, _, _ in results] == req_ids
+    assert [text for _, text, _ in results] == ['Role {} engineer'.format(req_id) for req_id in req_ids]
+
+
+def test_5xx_is_retried_with_backoff(jobs_url):
+    start = time.perf_counter()
+    [(_, text, error)] = fetch_reqs(['flaky1'], retries=3, backoff=0.05)
+    assert error is None and text == 'Role flaky1 engineer'
+    assert JobsHandler.hits['flaky1'] == 3
+    assert time.perf_counter() - start >= 0.05 + 0.1  # Two sleeps, the second doubled
+
+
+def test_retries_run_out(jobs_url):
+    [(_, text, error)] = fetch_reqs(['down1'], retries=2, backoff=0)
+    assert text is None and isinstance(error, PageFetchException) and error.status_code == 503
+    assert JobsHandler.hits['down1'] == 3
+
+
+def test_timeout_is_reported_per_req(jobs_url):
+    results = fetch_reqs(['slow1', 'r1', 'empty1'], retries=0, backoff=0, timeout=0.1)
+    (_, slow_text, slow_error), (_, text, error), (_, empty_text, empty_error) = results
+    assert slow_text is None and isinstance(slow_error, PageFetchException) and slow_error.status_code is None
+    assert text == 'Role r1 engineer' and error is None
+    assert empty_text is None and empty_error.element == 'job_description'
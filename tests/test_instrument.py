@@ -0,0 +1,20 @@
+import pstats
+
+from components.instrument import Instrumentation
+
+
+def _work():
+    return sum(range(1000))
+
+
+def test_nested_profiled_stages_keep_profiling_the_outer_stage():
+    instruments = Instrumentation()
+    instruments.enable(profile_stages=['outer', 'inner'])
+    with instruments.stage('outer'):
+        with instruments.stage('inner'):
+            _work()
+        _work()  # Still inside outer, after inner has exited
+    _work()
+    calls = {func[2]: stats[0] for func, stats in pstats.Stats(instruments.profiler).stats.items()}
+    assert calls['_work'] == 2
+    assert instruments.timings['outer'][0] == instruments.timings['inner'][0] == 1
@@ -0,0 +1,18 @@
+import pytest
+
+import corpus
+from app_config import Config
+
+pytest.importorskip('numpy')
+pytest.importorskip('bs4')
+pytest.importorskip('pandas')
+
+
+def test_approximate_frequencies_note_their_error_bound(stopwords, tmp_path, monkeypatch):
+    from wordscan import AvatureWordCounts
+    monkeypatch.setattr(Config, 'COUNT_BACKEND', 'approximate')
+    monkeypatch.setattr(Config, 'SKETCH_EPSILON', 0.01)
+    mode = AvatureWordCounts(stem=False, lemma=False, phrases=False, sort_by='df',
+                             zip_path=corpus.quickview_zip(30, base=str(tmp_path)))
+    assert len(mode.results(topn=10)) == 10
+    assert [note.split(':')[0] for note in mode.notes] == ["Approximate counts", "Approximate frequencies"]
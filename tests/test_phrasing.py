@@ -0,0 +1,43 @@
+import pytest
+
+from components.phrasing import CompiledPhraser
+
+gensim_phrases = pytest.importorskip('gensim.models.phrases')
+
+CONNECTORS = frozenset(['of', 'the', 'and', 'on'])
+TRAINING = [
+    ['machine', 'learning', 'and', 'data', 'science'],
+    ['bank', 'of', 'america', 'hired', 'data', 'science', 'staff'],
+    ['ruby', 'on', 'rails', 'and', 'machine', 'learning'],
+    ['the', 'bank', 'of', 'america', 'and', 'ruby', 'on', 'rails'],
+    ['machine', 'learning', 'at', 'bank', 'of', 'america'],
+    ['data', 'science', 'with', 'ruby', 'on', 'rails'],
+] * 3
+SENTENCES = [
+    ['senior', 'machine', 'learning', 'engineer'],
+    ['bank', 'of', 'america', 'and', 'the', 'data', 'science', 'team'],
+    ['of', 'the', 'ruby', 'on', 'rails'],  # Connectors never start a phrase
+    ['ruby', 'on', 'the', 'rails'],  # Nor are two connectors between the parts one of the phrase's
+    ['machine', 'learning', 'of'],  # Nor end one
+    ['learning', 'machine', 'learning', 'machine'],
+    ['bank', 'of'],
+    ['of'],
+    [],
+]
+
+
+@pytest.fixture(scope='module')
+def frozen():
+    return gensim_phrases.Phrases(TRAINING, min_count=1, threshold=0.1, connector_words=CONNECTORS).freeze()
+
+
+def test_compiled_phrases_match_gensim(frozen):
+    phraser = CompiledPhraser.from_gensim(frozen)
+    assert 'bank_of_america' in phraser.phrases
+    for sentence in SENTENCES:
+        assert phraser[sentence] == frozen[sentence], sentence
+
+
+def test_batches_match_gensim(frozen):
+    phraser = CompiledPhraser.from_gensim(frozen)
+    assert list(phraser[SENTENCES[:-1]]) == list(frozen[SENTENCES[:-1]])
@@ -0,0 +1,13 @@
+import corpus
+from components.preprocessing import FILTERS, TOKENIZER, apply_filters
+
+
+def test_tokenizer_matches_filters_on_synthetic_corpus(stopwords):
+    generator = corpus.TextGenerator(seed=corpus.DEFAULT_SEED)
+    docs = [generator.document() for _ in range(300)]
+    docs.append(generator.quickview_html())
+    docs.append(generator.job_description_html())
+    docs.extend(["C++ / C# and node.js, 3D-printing at <b>ACME</b> 2019!", "e-mail: jo@example.com (2x faster)",
+                 "Ünïcode résumé — naïve café", "", "   \n\t  "])
+    for doc in docs:
+        assert TOKENIZER.tokenize(doc) == apply_filters(doc, FILTERS)
@@ -0,0 +1,58 @@
+from components.preprocessing import TOKENIZER
+from components.skills import SkillMatcher
+
+SKILLS = {'Ruby on Rails': 10, 'machine learning': 8, 'machine': 1, 'Node.js': 5, 'project management': 7,
+          'Objective-C': 3, 'C++': 4, 'R': 2, 'python': 9}
+
+
+def test_multi_word_skills_match_cleaned_text(stopwords):
+    matcher = SkillMatcher(SKILLS)
+    text = ("Built Ruby on Rails services and machine-learning models in Python. Led project management "
+            "for a Node.js rewrite; some Objective-C and C++ too.")
+    counts = matcher.count(TOKENIZER.tokenize(text))
+    assert counts == {'Ruby on Rails': 1, 'machine learning': 1, 'machine': 1, 'Node.js': 1,
+                      'project management': 1, 'Objective-C': 1, 'python': 1}
+
+
+def test_phrased_tokens_are_matched_word_by_word(stopwords):
+    matcher = SkillMatcher(SKILLS)
+    assert matcher.count(['applied', 'machine_learning', 'ruby', 'rails']) == {
+        'machine learning': 1, 'machine': 1, 'Ruby on Rails': 1}
+
+
+def test_skills_that_clean_to_nothing_are_reported(stopwords):
+    matcher = SkillMatcher(SKILLS)
+    assert sorted(matcher.unmatchable) == ['C++', 'R']
+    assert 'C++' not in matcher.skills_set
+
+
+def test_compiled_matcher_round_trips(stopwords, tmp_path):
+    matcher = SkillMatcher(SKILLS)
+    path = str(tmp_path / 'skills.automaton')
+    matcher.save(path, 'source')
+    loaded = SkillMatcher.load(path, 'source')
+    tokens = TOKENIZER.tokenize("Ruby on Rails and project management")
+    assert loaded.count(tokens) == matcher.count(tokens)
+    assert loaded.unmatchable == matcher.unmatchable and loaded.ambiguous == matcher.ambiguous
+    assert SkillMatcher.load(path, 'other source') is None
+
+
+def test_skills_that_collapse_onto_other_words_are_not_counted(stopwords):
+    matcher = SkillMatcher({'System Design': 5, 'Web Design': 4, 'design': 3, 'Data Analysis': 2, 'analysis': 1,
+                            'Design': 1, 'Web Development': 1})
+    text = "Responsible for the design of a billing system; wrote an analysis."
+    assert matcher.count(TOKENIZER.tokenize(text)) == {'design': 1, 'analysis': 1}
+    assert sorted(matcher.ambiguous) == ['Data Analysis', 'Design', 'System Design', 'Web Design']
+    assert matcher.unmatchable == ['Web Development']
+
+
+def test_compiled_matcher_is_rebuilt_when_stopwords_change(stopwords, tmp_path, monkeypatch):
+    import pickle
+
+    from components.models import load_skill_matcher
+    path, compiled = str(tmp_path / 'skills.pkl'), str(tmp_path / 'skills.automaton')
+    with open(path, 'wb') as f:
+        pickle.dump(SKILLS, f)
+    assert 'python' in load_skill_matcher(path, compiled).skills_set
+    monkeypatch.setattr(stopwords, '_words', stopwords.load() | {'python'})
+    assert 'python' in load_skill_matcher(path, compiled).unmatchable
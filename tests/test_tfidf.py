@@ -0,0 +1,40 @@
+import heapq
+
+import pytest
+
+pytest.importorskip('scipy')
+gensim_models = pytest.importorskip('gensim.models')
+gensim_corpora = pytest.importorskip('gensim.corpora')
+
+from components.tfidf import TfidfScorer, score_corpus, score_documents  # noqa: E402
+
+CORPUS = [['sql', 'java', 'excel'], ['java', 'python'], ['excel', 'sql', 'python'], ['go']]
+
+
+@pytest.fixture(scope='module')
+def model():
+    dictionary = gensim_corpora.Dictionary(CORPUS)
+    return gensim_models.TfidfModel([dictionary.doc2bow(doc) for doc in CORPUS], id2word=dictionary)
+
+
+def _ranked(model, doc, topn):
+    # gensim's weights in term ID order, ranked with ties kept in that order
+    weights = [(model.id2word[term_id], weight) for term_id, weight in model[model.id2word.doc2bow(doc)]]
+    return heapq.nlargest(topn, weights, key=lambda item: item[1])
+
+
+def test_tied_document_weights_rank_in_term_id_order(model):
+    docs = [['python', 'java', 'sql', 'excel'], ['excel', 'sql'], ['sql', 'excel', 'java', 'java']]
+    for topn in (1, 2, 4):
+        ranked = list(score_documents(TfidfScorer(model), docs, topn=topn))
+        for doc, terms in zip(docs, ranked):
+            expected = _ranked(model, doc, topn)
+            assert [term for term, _ in terms] == [term for term, _ in expected]
+            assert [weight for _, weight in terms] == pytest.approx([weight for _, weight in expected])
+
+
+def test_tied_corpus_weights_rank_in_term_id_order(model):
+    scorer = TfidfScorer(model)
+    top = score_corpus(scorer, [['sql', 'excel'], ['excel', 'sql']]).top(2)
+    assert [term for term, _ in top] == sorted(['sql', 'excel'], key=model.id2word.token2id.get)
+    assert top[0][1] == pytest.approx(top[1][1])
@@ -0,0 +1,19 @@
+import heapq
+
+import pytest
+
+from components.vocab import top_indices
+
+np = pytest.importorskip('numpy')
+
+
+@pytest.mark.parametrize('n', [None, 0, 1, 3, 5, 8, 20])
+def test_ties_keep_index_order_like_heapq(n):
+    values = np.array([3, 1, 3, 2, 5, 3, 2, 5, 0, 1, 3, 2], dtype=np.int64)
+    expected = heapq.nlargest(len(values) if n is None else n, range(len(values)), key=values.__getitem__)
+    assert top_indices(values, n).tolist() == expected
+
+
+def test_float_ties_keep_index_order():
+    values = np.array([0.5, 0.25, 0.5, 0.5, 0.75, 0.25])
+    assert top_indices(values, 4).tolist() == [4, 0, 2, 3]
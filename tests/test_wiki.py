@@ -0,0 +1,73 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from app_config import Config
+from components.avature import _iter_fetch_text
+from components.http_cache import ResponseCache
+from components.wikiscraper import get_wiki_text, iter_wiki_text, parse_wiki_sources
+
+HEAD = '<html><body><div class="mw-parser-output"><p>First paragraph</p>'
+TAIL = '<ul><li>Listed</li></ul></div></body></html>'
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    """
+    Serves the head of an article, then holds the rest back until the test sets release
+    """
+
+    release = threading.Event()
+    hits = 0
+
+    def do_GET(self):
+        PageHandler.hits += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.end_headers()
+        self.wfile.write(HEAD.encode('utf-8'))
+        self.wfile.flush()
+        self.release.wait(5)
+        self.wfile.write(TAIL.encode('utf-8'))
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def page_url(monkeypatch):
+    pytest.importorskip('requests')
+    PageHandler.release = threading.Event()
+    PageHandler.hits = 0
+    server = HTTPServer(('127.0.0.1', 0), PageHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(Config, 'FETCH_CHUNK_SIZE', 16)  # Small enough that the head arrives in whole chunks
+    yield 'http://127.0.0.1:{}/wiki/Washington,_D.C.'.format(server.server_address[1])
+    PageHandler.release.set()
+    server.shutdown()
+    server.server_close()
+
+
+def _first_then_rest(texts):
+    first = next(texts)
+    PageHandler.release.set()
+    return [first] + list(texts)
+
+
+def test_sources_split_on_lines_or_comma_and_space():
+    assert parse_wiki_sources("https://en.wikipedia.org/wiki/Washington,_D.C., C:\\Saved Pages\n/tmp/a b ") == [
+        'https://en.wikipedia.org/wiki/Washington,_D.C.', 'C:\\Saved Pages', '/tmp/a b']
+    assert parse_wiki_sources(['a, b', ' ', 'c']) == ['a, b', 'c']
+
+
+def test_texts_stream_before_the_page_finishes(page_url, monkeypatch):
+    monkeypatch.setattr(Config, 'HTTP_CACHE_ENABLED', False)
+    assert _first_then_rest(get_wiki_text(page_url)) == ['First paragraph', 'Listed']
+
+
+def test_cached_texts_stream_and_are_stored_whole(page_url, tmp_path):
+    cache = ResponseCache(str(tmp_path / 'http.sqlite'))
+    assert _first_then_rest(_iter_fetch_text(page_url, iter_wiki_text, cache=cache)) == ['First paragraph', 'Listed']
+    assert list(_iter_fetch_text(page_url, iter_wiki_text, cache=cache)) == ['First paragraph', 'Listed']
+    assert PageHandler.hits == 1 and cache.hits == 1
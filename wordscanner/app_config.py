@@ -1,9 +1,52 @@
 import os
 
 basedir = os.path.abspath(os.path.dirname(__file__))
+cachedir = os.environ.get('WORDSCAN_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.wordscan'))
 
 
 class Config(object):
     PHRASER_PATH = os.path.join(basedir, 'models{}phraser.model'.format(os.path.sep))
     TFIDF_PATH = os.path.join(basedir, 'models{}tfidf_lem_bigrams.model'.format(os.path.sep))
     SKILLS_PATH = os.path.join(basedir, 'models{}skills.pkl'.format(os.path.sep))
+    SKILL_MATCHER_PATH = os.path.join(cachedir, 'skills.automaton')  # Compiled from SKILLS_PATH when out of date
+
+    LEMMA_CACHE_SIZE = 100000  # (token, POS) pairs kept by the lemma cache, None for unbounded
+    LEMMA_CACHE_POLICY = 'lru'  # 'lru' or 'fifo'
+    POS_BATCH_SIZE = 256  # documents whose sentences are POS tagged together by clean_many
+    SENTENCE_CHUNK_SIZE = 64 * 1024  # Characters sentence split at a time by the streaming sentence pipeline
+    SENTENCE_MAX_CHARS = 1024 * 1024  # Text without a sentence boundary for this long is cut into a sentence
+    SENTENCE_BATCH_SIZE = 1024  # Sentences POS tagged and phrased together
+    CLEAN_WORKERS = os.cpu_count() or 1  # processes used to clean multiple documents, 1 to stay serial
+    CLEAN_CHUNK_SIZE = 64  # documents sent to a cleaning worker at a time
+    COUNT_BACKEND = 'exact'  # 'exact', 'approximate' for fixed memory Space-Saving counts, 'sharded' to spill to disk
+    COUNT_FLUSH_TOKENS = 1 << 20  # Token IDs buffered before exact counts are updated with NumPy
+    SKETCH_EPSILON = 0.0001  # Approximate counts are overstated by at most this share of all tokens counted
+    SHARD_DIR = None  # Where sharded counts spill; None for a temporary directory, shards in a set one are kept
+    SHARD_MEMORY_BYTES = 256 * 2 ** 20  # Estimated size of in-memory sharded counts before they spill to a shard
+    TFIDF_BATCH_SIZE = 1024  # Documents vectorized into one sparse matrix by the TF-IDF mode
+    AVATURE_EXTRACT = False  # Also extract Quick View zips next to the archive and read from that directory
+    HTML_PARSER = 'html.parser'  # BeautifulSoup backend for Quick View files, 'lxml' is faster but rewrites \r\n
+    DEDUP_ENABLED = False  # Collapse near-duplicate Quick View resumes before they are cleaned and counted
+    DEDUP_THRESHOLD = 0.8  # Estimated Jaccard similarity of word shingles at which resumes are duplicates
+    DEDUP_NUM_PERM = 128  # MinHash permutations, more estimate similarity closer but take longer to hash
+    DEDUP_SHINGLE_SIZE = 5  # Words per shingle
+
+    INSTRUMENT = bool(os.environ.get('WORDSCAN_INSTRUMENT'))  # Time pipeline stages and print a summary after runs
+    TRACE_MAX_EVENTS = 100000  # Stage calls kept for a JSON trace, later ones are only totalled
+
+    CISCO_JOBS_URL = "https://jobs.cisco.com/jobs/ProjectDetail/{}"
+    FETCH_WORKERS = 8  # Requisitions fetched concurrently
+    FETCH_TIMEOUT = 15  # Seconds, per request
+    FETCH_RETRIES = 3  # Retries after a 5xx or connection error
+    FETCH_BACKOFF = 0.5  # Seconds before the first retry, doubled for each one after
+    FETCH_CHUNK_SIZE = 64 * 1024  # Bytes read at a time from pages that are parsed as they stream in
+
+    HTTP_CACHE_ENABLED = True
+    HTTP_CACHE_PATH = os.path.join(cachedir, 'http.sqlite')
+    HTTP_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    HTTP_CACHE_TTL = 24 * 60 * 60  # Seconds before a cached page is revalidated
+    HTTP_CACHE_OFFLINE = bool(os.environ.get('WORDSCAN_OFFLINE'))  # Serve only from the cache, never the network
+
+    TOKEN_CACHE_ENABLED = True  # Reuse cleaned tokens of documents seen before with the same cleaning options
+    TOKEN_CACHE_PATH = os.path.join(cachedir, 'tokens.sqlite')
+    TOKEN_CACHE_MAX_BYTES = 512 * 1024 * 1024
@@ -0,0 +1,215 @@
+"""
+Headless entry point for the wordscan modes
+
+Reads documents from files, directories or stdin (one document per line) and writes result rows as they are
+produced, as JSON lines or CSV. For example:
+
+    python batch.py words resumes/ --lemma --top 50 --output counts.jsonl
+    cat jds.txt | python batch.py keywords - --per-document --format csv
+    python batch.py avature export.zip --sort df
+    python batch.py avature export.zip --dedup --dedup-threshold 0.9
+    python batch.py tfidf resumes/ --lemma --phrases --per-document --top 10
+    python batch.py words resumes/ --lemma --timings --trace trace.json --profile pos_tag
+    python batch.py avature export.zip --backend sharded --shard-dir shards/host1
+    python batch.py shards shards/host1 shards/host2 --top 100
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+from collections import deque
+
+from app_config import Config
+from components.instrument import INSTRUMENTS, stage
+from wordscan import (KeywordSearch, SkillSearch, WordCounts, TfidfWordCounts, WikiWordCounts, AvatureWordCounts,
+                      CiscoJobsWordCounts, CiscoJobsKeywords, ShardWordCounts)
+
+
+def iter_documents(paths, encoding='utf-8'):
+    """
+    :param paths: files, directories (walked recursively, in sorted order) or '-' for stdin
+    :return: generator of (document name, text)
+    """
+    for path in paths:
+        if path == '-':
+            for line_number, line in enumerate(sys.stdin, 1):
+                if line.strip():
+                    yield 'stdin:{}'.format(line_number), line.rstrip('\n')
+        elif os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for fname in sorted(files):
+                    file_path = os.path.join(root, fname)
+                    yield file_path, _read_file(file_path, encoding)
+        else:
+            yield path, _read_file(path, encoding)
+
+
+def _read_file(path, encoding):
+    with open(path, 'r', encoding=encoding, errors='replace') as f:
+        return f.read()
+
+
+class JsonlWriter(object):
+
+    def __init__(self, out, columns):
+        self.out = out
+        self.columns = columns
+
+    def write(self, rows, document=None):
+        for row in rows:
+            record = dict(zip(self.columns, row))
+            if document is not None:
+                record = dict(document=document, **record)
+            self.out.write(json.dumps(record) + "\n")
+        self.out.flush()
+
+
+class CsvWriter(object):
+
+    def __init__(self, out, columns, per_document=False):
+        self.out = out
+        self.writer = csv.writer(out)
+        self.writer.writerow((('document',) if per_document else ()) + tuple(columns))
+
+    def write(self, rows, document=None):
+        for row in rows:
+            self.writer.writerow(((document,) if document is not None else ()) + tuple(row))
+        self.out.flush()
+
+
+WRITERS = {'jsonl': JsonlWriter, 'csv': CsvWriter}
+
+
+def build_mode(args, texts):
+    cleaning = dict(stem=args.stem, lemma=args.lemma, phrases=args.phrases)
+    if args.mode == 'words':
+        return WordCounts(multiple=True, text=texts, **cleaning)
+    if args.mode == 'tfidf':
+        return TfidfWordCounts(multiple=True, text=texts, **cleaning)
+    if args.mode == 'skills':
+        return SkillSearch(multiple=True, text=texts)
+    if args.mode == 'keywords':
+        return KeywordSearch(multiple=True, text=texts)
+    if args.mode == 'avature':
+        return AvatureWordCounts(zip_path=args.inputs[0], sort_by=args.sort, dedup=args.dedup, **cleaning)
+    if args.mode == 'wiki':
+        return WikiWordCounts(url=args.inputs, **cleaning)
+    if args.mode == 'cisco':
+        return CiscoJobsWordCounts(req_ids=args.inputs, **cleaning)
+    if args.mode == 'cisco-keywords':
+        return CiscoJobsKeywords(req_ids=args.inputs)
+    if args.mode == 'shards':
+        return ShardWordCounts(shards=args.inputs, sort_by=args.sort)
+    raise ValueError("Unknown mode {}".format(args.mode))
+
+
+DOCUMENT_MODES = ('words', 'tfidf', 'skills', 'keywords')
+TOPN_MODES = ('words', 'tfidf', 'keywords', 'avature', 'wiki', 'cisco', 'cisco-keywords', 'shards')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run a wordscan mode without the GUI")
+    parser.add_argument('mode', choices=['words', 'tfidf', 'skills', 'keywords', 'avature', 'wiki', 'cisco',
+                                         'cisco-keywords', 'shards'])
+    parser.add_argument('inputs', nargs='+',
+                        help="files, directories or - for stdin; a zip for avature; URLs or saved pages for wiki; "
+                             "req IDs for cisco; shard files or directories for shards")
+    parser.add_argument('--stem', action='store_true')
+    parser.add_argument('--lemma', action='store_true')
+    parser.add_argument('--phrases', action='store_true')
+    parser.add_argument('--top', type=int, default=100, help="rows per result, where the mode supports it")
+    parser.add_argument('--sort', choices=['count', 'df'], default='count', help="avature and shards ranking")
+    parser.add_argument('--dedup', action='store_true', default=None,
+                        help="avature: collapse near-duplicate resumes before counting, see Config.DEDUP_THRESHOLD")
+    parser.add_argument('--dedup-threshold', type=float, help="estimated similarity at which resumes are duplicates")
+    parser.add_argument('--num-perm', type=int, help="MinHash permutations used by --dedup")
+    parser.add_argument('--per-document', action='store_true',
+                        help="write each document's results as it is processed instead of corpus totals")
+    parser.add_argument('--format', choices=sorted(WRITERS), default='jsonl')
+    parser.add_argument('--output', default='-', help="file to write, - for stdout")
+    parser.add_argument('--encoding', default='utf-8', help="encoding of input files")
+    parser.add_argument('--approximate', action='store_true',
+                        help="count in fixed memory with Space-Saving summaries, see Config.SKETCH_EPSILON")
+    parser.add_argument('--backend', choices=['exact', 'approximate', 'sharded'],
+                        help="counting backend, default Config.COUNT_BACKEND; sharded spills counts to disk past "
+                             "Config.SHARD_MEMORY_BYTES")
+    parser.add_argument('--shard-dir', help="keep sharded counts here, to merge later with the shards mode")
+    parser.add_argument('--timings', action='store_true', help="print time spent in each pipeline stage to stderr")
+    parser.add_argument('--trace', metavar='PATH', help="write stage totals, counters and a Chrome trace as JSON")
+    parser.add_argument('--profile', metavar='STAGE', action='append', default=[],
+                        help="run this stage under cProfile in the main process, repeatable")
+    parser.add_argument('--profile-out', default='wordscan.prof', help="where --profile writes its pstats file")
+    args = parser.parse_args(argv)
+    if args.per_document and args.mode not in DOCUMENT_MODES:
+        parser.error("--per-document is only available for {}".format(", ".join(DOCUMENT_MODES)))
+    if args.mode == 'avature' and len(args.inputs) > 1:
+        parser.error("avature reads one Quick View zip, got {}".format(len(args.inputs)))
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.approximate:
+        Config.COUNT_BACKEND = 'approximate'
+    if args.backend:
+        Config.COUNT_BACKEND = args.backend
+    if args.shard_dir:
+        Config.SHARD_DIR = args.shard_dir
+    if args.dedup_threshold is not None:
+        Config.DEDUP_THRESHOLD = args.dedup_threshold
+    if args.num_perm is not None:
+        Config.DEDUP_NUM_PERM = args.num_perm
+    if args.timings or args.trace or args.profile:
+        INSTRUMENTS.enable(trace=bool(args.trace), profile_stages=args.profile)
+
+    names = deque()  # Names of documents read but not yet written, at most one cleaning batch
+
+    def texts():
+        for name, text in iter_documents(args.inputs, args.encoding):
+            if args.per_document:
+                names.append(name)
+            yield text
+
+    mode = build_mode(args, texts() if args.mode in DOCUMENT_MODES else None)
+    for req_id, error in getattr(mode, 'fetch_errors', []):
+        print("Req {} : {}".format(req_id, error), file=sys.stderr)
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', encoding='utf-8')
+    try:
+        if args.format == 'csv':
+            writer = CsvWriter(out, mode.columns, per_document=args.per_document)
+        else:
+            writer = JsonlWriter(out, mode.columns)
+
+        with stage('results'):
+            if args.per_document:
+                results = mode.document_results(args.top) if args.mode in TOPN_MODES else mode.document_results()
+                for rows in results:
+                    writer.write(rows, document=names.popleft())
+            else:
+                writer.write(mode.results(args.top) if args.mode in TOPN_MODES else mode.results())
+        for note in mode.notes:
+            print(note, file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if INSTRUMENTS.enabled:
+        _report_instruments(args)
+    return 0
+
+
+def _report_instruments(args):
+    if args.timings:
+        print(INSTRUMENTS.summary(), file=sys.stderr)
+    if args.trace:
+        INSTRUMENTS.write_json(args.trace)
+    if args.profile:
+        INSTRUMENTS.write_profile(args.profile_out)
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -1,11 +1,11 @@
 import os
-from bs4 import UnicodeDammit
-from bs4 import BeautifulSoup as bs4
 import re
-import requests
-import pandas as pd
+import time
 from unicodedata import normalize
 import zipfile
+from app_config import Config
+from .http_cache import get_response_cache
+from .instrument import count, stage
 
 
 class PageFetchException(Exception):
@@ -23,116 +23,271 @@ class ElementNotFoundException(Exception):
 
 JD_HEADERS = re.compile(r"^(What|Who|Why)")
 
-def _get_soups(zip_path):
+# Quick View column, element class pattern and the label prefixed to its text
+QUICKVIEW_FIELDS = [('fname', re.compile("firstName"), 'First Name'),
+                    ('lname', re.compile("lastName"), 'Last Name'),
+                    ('title', re.compile("jobTitle"), 'Job title'),
+                    ('emp', re.compile("employer"), 'Current employer'),
+                    ('Resume', re.compile("value attachment"), None)]
+QUICKVIEW_CLASSES = re.compile("|".join(pattern.pattern for _, pattern, _ in QUICKVIEW_FIELDS))
+EXTRA_NEWLINES = re.compile('((\\n) ?){2,}')
 
+
+def _decode_html(raw):
+    """
+    Decodes an HTML file once, trying UTF-8 (dropping a BOM, as bs4 does), then the encoding UnicodeDammit detects,
+    then latin-1
     """
-    Given a zipped folder, unzips
-    Iterates through each unzipped file, reading and parsing HTML
+    from bs4 import UnicodeDammit
+    try:
+        return raw.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        pass
+    markup = UnicodeDammit(raw).unicode_markup
+    if markup is not None:
+        return markup
+    return raw.decode('latin-1')
+
+
+def _iter_zip_files(zip_path, extract=Config.AVATURE_EXTRACT):
+
+    """
+    Reads each file in a zipped folder, one at a time
     :param zip_path: path to zipfile
-    :return:
+    :param extract: read from (and if needed create) an extracted copy next to the zipfile instead
+    :return: generator of (file name, raw bytes)
     """
 
+    if extract:
+        yield from _iter_extracted_files(zip_path)
+        return
+
+    with zipfile.ZipFile(zip_path, 'r') as zip_file:
+        for member in zip_file.infolist():
+            if member.filename.endswith('/'):
+                continue
+            with stage('avature.read'):
+                raw = zip_file.read(member)
+            count('avature.files')
+            count('avature.bytes', len(raw))
+            yield member.filename, raw
+
+
+def _iter_extracted_files(zip_path):
     zip_dir, zip_fname = os.path.split(zip_path)
     zip_fname = os.path.splitext(zip_fname)[0]
     zip_output_dir = os.path.join(zip_dir, zip_fname)
 
     if not os.path.isdir(zip_output_dir):  # Already extracted
-        zip_file = zipfile.ZipFile(zip_path, 'r')
-        zip_file.extractall(zip_output_dir)
-        zip_file.close()
+        with zipfile.ZipFile(zip_path, 'r') as zip_file:
+            zip_file.extractall(zip_output_dir)
 
-    files = []
-    for sf in os.listdir(zip_output_dir):
-        files.append(os.path.join(zip_output_dir, sf))
+    for sf in sorted(os.listdir(zip_output_dir)):
+        sf_path = os.path.join(zip_output_dir, sf)
+        if not os.path.isfile(sf_path):
+            continue
+        with stage('avature.read'):
+            with open(sf_path, 'rb') as html_file:
+                raw = html_file.read()
+        count('avature.files')
+        count('avature.bytes', len(raw))
+        yield sf, raw
 
-    soups = []
-    for sf in files:
-        try:
-            with open(sf, 'rb') as html_file:
-                html = html_file.read()
-            soup = bs4(html, 'html.parser')
-        except UnicodeError:
-            with open(sf, 'rb') as html_file:
-                html = html_file.read()
-                html = UnicodeDammit(html).unicode_markup
-            soup = bs4(html, 'html.parser')
-        soups.append(soup)
-    return soups
-
-
-def extract_quickview(zip_path):
-    soups = _get_soups(zip_path)
-    people = []
-
-    for soup in soups:
-        fname = soup.find_all(class_=re.compile("firstName"))
-        if fname:
-            fname = fname[0].get_text()
-        else:
-            fname = ''
 
-        lname = soup.find_all(class_=re.compile("lastName"))
-        if lname:
-            lname = lname[0].get_text()
-        else:
-            lname = ''
+def _get_soups(zip_path, extract=Config.AVATURE_EXTRACT, parse_only=None):
 
-        title = soup.find_all(class_=re.compile("jobTitle"))
-        if title:
-            title = title[0].get_text()
-        else:
-            title = ''
+    """
+    Given a zipped folder, parses each file's HTML
+    Only one file is held in memory at a time
+    :param zip_path: path to zipfile
+    :param parse_only: optional SoupStrainer limiting which elements are built
+    :return: generator of BeautifulSoup
+    """
 
-        emp = soup.find_all(class_=re.compile("employer"))
-        if emp:
-            emp = emp[0].get_text()
-        else:
-            emp = ''
+    from bs4 import BeautifulSoup as bs4
+    for _, html in _iter_zip_files(zip_path, extract):
+        with stage('avature.decode'):
+            markup = _decode_html(html)
+        with stage('avature.parse_html'):
+            soup = bs4(markup, Config.HTML_PARSER, parse_only=parse_only)
+        yield soup
 
-        res = soup.find_all(class_=re.compile("value attachment"))
-        if res:
-            res = res[0].get_text()
-        else:
-            res = ''
 
-        td = {'fname': fname, 'lname': lname, 'title': title, 'emp': emp, 'Resume': res}
-        people.append(td)
+def _class_matches(pattern, classes):
+    # Same rule as find_all(class_=pattern): any single class, or the whole class attribute
+    return any(pattern.search(c) for c in classes) or pattern.search(" ".join(classes))
 
-    df = pd.DataFrame(people)
 
-    def split_or_none(x, splitter):
-        l = x.split(splitter)
-        if len(l) == 2:
-            return l[1]
-        else:
-            return ''
+def _extract_fields(soup):
+    """
+    Text of the first element matching each of QUICKVIEW_FIELDS, found in one traversal
+    """
+    person = {column: '' for column, _, _ in QUICKVIEW_FIELDS}
+    remaining = list(QUICKVIEW_FIELDS)
+    for element in soup.find_all(class_=True):
+        classes = element.get('class')
+        if isinstance(classes, str):
+            classes = classes.split()
+        for field in list(remaining):
+            column, pattern, _ = field
+            if _class_matches(pattern, classes):
+                person[column] = element.get_text()
+                remaining.remove(field)
+        if not remaining:
+            break
+    return person
+
+
+def iter_quickview(zip_path, extract=Config.AVATURE_EXTRACT):
 
-    df['fname'] = df['fname'].apply(lambda x: split_or_none(x, 'First Name'))
+    """
+    Yields the raw fields of each Quick View profile in a zipped export, one profile at a time
+    Only elements carrying one of the field classes are parsed
+    :param zip_path: path to zipfile
+    :return: generator of dict with fname, lname, title, emp and Resume
+    """
 
-    df['lname'] = df['lname'].apply(lambda x: split_or_none(x, 'Last Name'))
+    from bs4 import SoupStrainer
+    for soup in _get_soups(zip_path, extract, parse_only=SoupStrainer(class_=QUICKVIEW_CLASSES)):
+        with stage('avature.fields'):
+            fields = _extract_fields(soup)
+        yield fields
 
-    df['emp'] = df['emp'].apply(lambda x: split_or_none(x, 'Current employer'))
 
-    df['title'] = df['title'].apply(lambda x: split_or_none(x, 'Job title'))
+def _clean_person(person):
+    # Per profile equivalent of _clean_quickview
+    for column, _, label in QUICKVIEW_FIELDS:
+        if label is None:
+            continue
+        parts = person[column].split(label)
+        person[column] = parts[1] if len(parts) == 2 else ''
+    person['Resume'] = EXTRA_NEWLINES.sub('\n', person['Resume'])
+    return person
 
-    extra_n = re.compile('((\\n) ?){2,}')
 
-    def trim_new_lines(x):
-        y = extra_n.sub('\n', x)
-        return y
+def iter_quickview_people(zip_path, extract=Config.AVATURE_EXTRACT):
+    """
+    Cleaned fields of each Quick View profile, as extract_quickview's rows, without building a DataFrame
+    :return: generator of dict with fname, lname, title, emp and Resume
+    """
+    for person in iter_quickview(zip_path, extract):
+        yield _clean_person(person)
 
-    df['Resume'] = df['Resume'].apply(lambda x: trim_new_lines(x))
 
+class QuickViewResumes(object):
+    """
+    Re-iterable stream of the resumes in a Quick View export, parsed again on every pass
+
+    Only one profile is held in memory at a time, however big the export.
+    """
+
+    def __init__(self, zip_path, extract=Config.AVATURE_EXTRACT):
+        self.zip_path = zip_path
+        self.extract = extract
+
+    def __iter__(self):
+        for person in iter_quickview_people(self.zip_path, self.extract):
+            yield person['Resume']
+
+
+def extract_quickview(zip_path, extract=Config.AVATURE_EXTRACT):
+    import pandas as pd
+    people = list(iter_quickview(zip_path, extract))
+    with stage('avature.frame'):
+        df = _clean_quickview(pd.DataFrame(people))
     return df
 
 
-def _fetch_req(req_num):
-    url = "https://jobs.cisco.com/jobs/ProjectDetail/{}".format(req_num)
-    r = requests.get(url)
-    if r.status_code != 200:
+def _clean_quickview(df):
+    # Labels are part of the element text, e.g. "First NameJane"
+    for column, _, label in QUICKVIEW_FIELDS:
+        if label is None:
+            continue
+        parts = df[column].str.split(label)
+        df[column] = parts.str[1].where(parts.str.len() == 2, '')
+
+    df['Resume'] = df['Resume'].str.replace(EXTRA_NEWLINES, '\n', regex=True)
+
+    return df
+
+
+def _get_page(url, session=None, timeout=Config.FETCH_TIMEOUT, retries=Config.FETCH_RETRIES,
+              backoff=Config.FETCH_BACKOFF, headers=None, stream=False):
+
+    """
+    GETs url, retrying with exponential backoff on connection errors and 5xx responses
+    :param session: requests.Session to pool connections with, defaults to the requests module
+    :param stream: leave the body to be read with iter_content
+    :return: response with status 200, or 304 when conditional headers were sent
+    """
+
+    import requests
+    session = session or requests
+    for attempt in range(retries + 1):
+        try:
+            r = session.get(url, timeout=timeout, headers=headers, stream=stream)
+        except requests.RequestException as e:
+            if attempt == retries:
+                raise PageFetchException(message="Getting page {} failed: {}".format(url, e), url=url,
+                                         status_code=None)
+        else:
+            if r.status_code < 500 or attempt == retries:
+                break
+        time.sleep(backoff * 2 ** attempt)
+
+    if r.status_code not in (200, 304):
         raise PageFetchException(message="Getting page {} returned status code {}".format(url, r.status_code), url=url,
                                  status_code=r.status_code)
-    page = bs4(r.content, 'html.parser')
+    return r
+
+
+def _fetch_text(url, extract, session=None, cache=None, **kwargs):
+
+    """
+    GETs url and returns extract(page content), through the response cache when there is one
+    :param cache: ResponseCache, defaults to the process-wide one
+    :param kwargs: timeout, retries and backoff passed to _get_page
+    """
+
+    cache = cache or get_response_cache()
+    count('fetch.pages')
+    with stage('fetch'):
+        if cache is None:
+            return extract(_get_page(url, session=session, **kwargs).content)
+
+        def request(headers):
+            return _get_page(url, session=session, headers=headers, **kwargs)
+
+        return cache.fetch(url, extract, request)
+
+
+def _iter_fetch_text(url, extract, session=None, cache=None, **kwargs):
+    """
+    Streaming _fetch_text, for an extract that takes an iterator of body chunks and yields pieces of text
+    :return: generator of the pieces, passed on while the page downloads
+    """
+    cache = cache or get_response_cache()
+    count('fetch.pages')
+
+    def request(headers=None):
+        with stage('fetch'):
+            return _get_page(url, session=session, headers=headers, stream=True, **kwargs)
+
+    if cache is None:
+        yield from extract(request().iter_content(Config.FETCH_CHUNK_SIZE))
+    else:
+        yield from cache.iter_fetch(url, extract, request)
+
+
+def _fetch_req(req_num, session=None, url_template=None, **kwargs):
+    url = (url_template or Config.CISCO_JOBS_URL).format(req_num)
+    return _fetch_text(url, _parse_req, session=session, **kwargs)
+
+
+def _parse_req(content):
+    from bs4 import BeautifulSoup as bs4
+    with stage('req.parse_html'):
+        page = bs4(content, 'html.parser')
     jd_element = page.find(class_="job_description")
     if not jd_element:
         raise ElementNotFoundException(message="Job Description Element Not Found", element="job_description")
@@ -166,11 +321,36 @@ def _fetch_req(req_num):
 
 
 class AvatureMixin(object):
+    """
+    :param dedup: collapse near-duplicate resumes, keeping the first of each group, defaults to Config.DEDUP_ENABLED
+    """
 
-    def __init__(self, zip_path):
-        self.text = self._df_to_text(zip_path)
-
-    @staticmethod
-    def _df_to_text(zip_path):
-        df = extract_quickview(zip_path)
-        return df['Resume'].values.tolist()
+    def __init__(self, zip_path, dedup=None):
+        self.duplicates = []  # Groups of row indices collapsed into their first row
+        self.duplicate_names = []
+        self.text = QuickViewResumes(zip_path)
+        if Config.DEDUP_ENABLED if dedup is None else dedup:
+            self._dedup(zip_path)
+
+    def _dedup(self, zip_path):
+        # Every resume is compared, so they are kept in memory, but only resumes and names
+        from .dedup import drop_duplicates, find_duplicates
+        resumes, names = [], []
+        for person in iter_quickview_people(zip_path):
+            resumes.append(person['Resume'])
+            names.append(" ".join((person['fname'] + " " + person['lname']).split()))
+        self.duplicates = find_duplicates(resumes, Config.DEDUP_THRESHOLD, Config.DEDUP_NUM_PERM)
+        self.duplicate_names = [[names[index] or "row {}".format(index) for index in group]
+                                for group in self.duplicates]
+        self.text = drop_duplicates(resumes, self.duplicates)
+
+    def duplicate_notes(self):
+        if not self.duplicates:
+            return []
+        collapsed = sum(len(group) - 1 for group in self.duplicates)
+        notes = ["Collapsed {} near-duplicate resumes into {} profiles:".format(collapsed, len(self.duplicates))]
+        for group, names in zip(self.duplicates, self.duplicate_names):
+            notes.append("  kept row {} ({}), dropped {}".format(
+                group[0], names[0], ", ".join("row {} ({})".format(index, name)
+                                             for index, name in zip(group[1:], names[1:]))))
+        return notes
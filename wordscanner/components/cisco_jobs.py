@@ -1,11 +1,102 @@
-from .avature import _fetch_req
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app_config import Config
+from .avature import _fetch_req, PageFetchException, ElementNotFoundException
+
+REQ_ID_SEPARATORS = re.compile(r"[\s,;]+")
+
+
+def parse_req_ids(text):
+    """
+    Splits user input such as "1234, 5678 9012" into req IDs, dropping blanks and repeats
+    """
+    if not text:
+        return []
+    if not isinstance(text, str):
+        return list(dict.fromkeys(text))
+    return list(dict.fromkeys(req_id for req_id in REQ_ID_SEPARATORS.split(text) if req_id))
+
+
+class ThreadSessions(object):
+    """
+    One requests.Session per thread, as sessions are not guaranteed to be thread-safe
+
+    Pool threads live as long as their executor, so each keeps its connections alive across the requests it makes.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+            session = self._local.session = requests.Session()
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def _fetch_req_in_thread(sessions, req_id, url_template, kwargs):
+    return _fetch_req(req_id, sessions.get(), url_template, **kwargs)
+
+
+def fetch_reqs(req_ids, max_workers=Config.FETCH_WORKERS, url_template=None, **kwargs):
+    """
+    Fetches many requisitions concurrently, each worker thread over its own pooled session
+
+    :param req_ids: list of req IDs
+    :param max_workers: most requests in flight at once
+    :param url_template: job page URL with a {} for the req ID, defaults to Config.CISCO_JOBS_URL
+    :param kwargs: timeout, retries and backoff passed to _get_page
+    :return: list of (req ID, job text or None, PageFetchException / ElementNotFoundException or None), in input order
+    """
+    url_template = url_template or Config.CISCO_JOBS_URL
+    max_workers = max(1, min(max_workers, len(req_ids)))
+    results = []
+    with ThreadSessions() as sessions, ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(_fetch_req_in_thread, sessions, req_id, url_template, kwargs) for req_id in req_ids]
+        for req_id, future in zip(req_ids, futures):
+            try:
+                results.append((req_id, future.result(), None))
+            except (PageFetchException, ElementNotFoundException) as e:
+                results.append((req_id, None, e))
+    return results
+
 
 class CiscoJobsMixin(object):
 
-    def __init__(self, req_id):
-        self.text = self.fetch_req(req_id)
+    def __init__(self, req_ids):
+        self.jobs = self.fetch_reqs(req_ids)
+        self.text = [job_text for _, job_text, error in self.jobs if error is None]
+        self.fetch_errors = [(req_id, error) for req_id, _, error in self.jobs if error is not None]
 
     @staticmethod
     def fetch_req(req_id):
         job_text = _fetch_req(req_id)
-        return job_text
\ No newline at end of file
+        return job_text
+
+    @staticmethod
+    def fetch_reqs(req_ids):
+        return fetch_reqs(parse_req_ids(req_ids))
+
+    def fetch_error_message(self):
+        lines = ["Req {} : {}".format(req_id, error) for req_id, error in self.fetch_errors]
+        return "These Jobs could not be fetched\n\n" + "\n".join(lines)
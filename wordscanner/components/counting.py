@@ -0,0 +1,341 @@
+import heapq
+import math
+from collections import Counter
+
+from app_config import Config
+from .vocab import TokenCorpus, Vocabulary, top_indices
+
+
+class TermStatistics(object):
+    """
+    Term counts and document frequencies built in one pass over cleaned documents
+
+    Each document is reduced to its set of unique terms as it is added, so document frequency never requires
+    rescanning documents. Statistics from separate workers combine with merge.
+    """
+
+    METRICS = ('count', 'df')
+
+    def __init__(self):
+        self.counts = Counter()
+        self.doc_freq = Counter()
+        self.n_docs = 0
+
+    def add_document(self, tokens):
+        self.counts.update(tokens)
+        self.doc_freq.update(dict.fromkeys(tokens, 1))  # Unique tokens, in a stable order
+        self.n_docs += 1
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        self.doc_freq.update(other.doc_freq)
+        self.n_docs += other.n_docs
+        return self
+
+    def df_ratio(self, term):
+        if not self.n_docs:
+            return 0.0
+        return self.doc_freq.get(term, 0) / self.n_docs
+
+    def error_bound(self):
+        """Most any count may be overstated by, always 0 for exact counts"""
+        return 0
+
+    def df_error_bound(self):
+        """Most any document frequency may be overstated by, always 0 for exact counts"""
+        return 0
+
+    def top(self, n=None, by='count'):
+        """
+        Highest ranked terms by count or document frequency
+
+        Uses a heap of size n rather than sorting the whole vocabulary. Ties keep first-seen order.
+        :param n: number of terms, None for all
+        :param by: 'count' or 'df'
+        :return: list of (term, count, df ratio)
+        """
+        if by not in self.METRICS:
+            raise ValueError("Unknown metric {}, expected one of {}".format(by, self.METRICS))
+        ranked = self.counts if by == 'count' else self.doc_freq
+        if n is None:
+            terms = sorted(ranked, key=ranked.get, reverse=True)
+        else:
+            terms = heapq.nlargest(n, ranked, key=ranked.get)
+        return [(term, self.counts[term], self.df_ratio(term)) for term in terms]
+
+
+class SpaceSaving(object):
+    """
+    Space-Saving heavy hitters summary (Metwally et al.) with a Counter-like interface
+
+    Tracks at most `capacity` items. An untracked item replaces the smallest tracked one and inherits its count as
+    error, so every estimate overstates the true count by at most error_bound(), itself at most total / capacity.
+    Summaries merge (Agarwal et al.), so each worker can keep its own.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+        self._heap = []  # (count, item), with stale entries skipped when popped
+
+    @classmethod
+    def from_error(cls, epsilon):
+        return cls(int(math.ceil(1 / epsilon)))
+
+    def update(self, items):
+        if not isinstance(items, dict):
+            items = Counter(items)
+        for item, weight in items.items():
+            self.add(item, weight)
+
+    def add(self, item, weight=1):
+        self.total += weight
+        counts = self.counts
+        if item in counts:
+            counts[item] += weight
+        elif len(counts) < self.capacity:
+            counts[item] = weight
+            self.errors[item] = 0
+        else:
+            min_count, min_item = self._pop_min()
+            del counts[min_item], self.errors[min_item]
+            counts[item] = min_count + weight
+            self.errors[item] = min_count
+        heapq.heappush(self._heap, (counts[item], item))
+        if len(self._heap) > 4 * self.capacity:
+            self._rebuild_heap()
+
+    def _pop_min(self):
+        while True:
+            count, item = heapq.heappop(self._heap)
+            if self.counts.get(item) == count:
+                return count, item
+
+    def _rebuild_heap(self):
+        self._heap = [(count, item) for item, count in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def _min_count(self):
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.values())
+
+    def merge(self, other):
+        self_min, other_min = self._min_count(), other._min_count()
+        counts, errors = {}, {}
+        for item in dict.fromkeys(list(self.counts) + list(other.counts)):
+            counts[item] = self.counts.get(item, self_min) + other.counts.get(item, other_min)
+            errors[item] = self.errors.get(item, self_min) + other.errors.get(item, other_min)
+        kept = heapq.nlargest(self.capacity, counts, key=counts.get)
+        self.counts = {item: counts[item] for item in kept}
+        self.errors = {item: errors[item] for item in kept}
+        self.total += other.total
+        self._rebuild_heap()
+        return self
+
+    def error_bound(self):
+        if len(self.counts) < self.capacity:
+            return max(self.errors.values(), default=0)
+        return self._min_count()
+
+    def most_common(self, n=None):
+        if n is None:
+            items = sorted(self.counts, key=self.counts.get, reverse=True)
+        else:
+            items = heapq.nlargest(n, self.counts, key=self.counts.get)
+        return [(item, self.counts[item]) for item in items]
+
+    def get(self, item, default=None):
+        return self.counts.get(item, default)
+
+    def __getitem__(self, item):
+        return self.counts.get(item, 0)
+
+    def __contains__(self, item):
+        return item in self.counts
+
+    def __iter__(self):
+        return iter(self.counts)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def items(self):
+        return self.counts.items()
+
+
+class ApproximateTermStatistics(TermStatistics):
+    """
+    TermStatistics in fixed memory, with counts and document frequencies kept in Space-Saving summaries
+
+    :param epsilon: counts are overstated by at most epsilon * tokens counted, document frequencies by at most
+    epsilon * documents counted, tracking about 1 / epsilon terms each. Defaults to Config.SKETCH_EPSILON
+    """
+
+    def __init__(self, epsilon=None):
+        epsilon = epsilon or Config.SKETCH_EPSILON
+        self.epsilon = epsilon
+        self.counts = SpaceSaving.from_error(epsilon)
+        self.doc_freq = SpaceSaving.from_error(epsilon)
+        self.n_docs = 0
+
+    def merge(self, other):
+        self.counts.merge(other.counts)
+        self.doc_freq.merge(other.doc_freq)
+        self.n_docs += other.n_docs
+        return self
+
+    def error_bound(self):
+        return self.counts.error_bound()
+
+    def df_error_bound(self):
+        return self.doc_freq.error_bound()
+
+    def top(self, n=None, by='count'):
+        if by not in self.METRICS:
+            raise ValueError("Unknown metric {}, expected one of {}".format(by, self.METRICS))
+        ranked = self.counts if by == 'count' else self.doc_freq
+        return [(term, self.counts[term], self.df_ratio(term)) for term, _ in ranked.most_common(n)]
+
+
+class TermCounts(object):
+    """
+    Read-only Counter-like view of a count array indexed by token ID
+    """
+
+    def __init__(self, vocab, values):
+        self.vocab = vocab
+        self.values = values
+
+    def most_common(self, n=None):
+        values = self.values[:len(self.vocab)]
+        top = top_indices(values, n)
+        top = top[values[top] > 0]
+        return list(zip(self.vocab.decode(top.tolist()), values[top].tolist()))
+
+    def get(self, term, default=None):
+        token_id = self.vocab.get(term)
+        if token_id is None or not self.values[token_id]:
+            return default
+        return int(self.values[token_id])
+
+    def __getitem__(self, term):
+        return self.get(term, 0)
+
+    def __contains__(self, term):
+        return self.get(term) is not None
+
+    def __iter__(self):
+        return iter(self.vocab.decode(self._nonzero()))
+
+    def __len__(self):
+        return len(self._nonzero())
+
+    def items(self):
+        ids = self._nonzero()
+        return list(zip(self.vocab.decode(ids), self.values[ids].tolist()))
+
+    def _nonzero(self):
+        import numpy as np
+        return np.flatnonzero(self.values[:len(self.vocab)]).tolist()
+
+
+class ArrayTermStatistics(TermStatistics):
+    """
+    TermStatistics over int32 token IDs, counted with NumPy
+
+    Documents are interned into a shared Vocabulary and buffered in a TokenCorpus. Every flush_tokens tokens the
+    buffer is reduced to per-ID count and document frequency arrays by bincount and is then emptied, so memory
+    holds the vocabulary plus two int64 arrays, however many documents are added. Statistics from separate workers
+    merge by remapping their IDs into this vocabulary. counts and doc_freq are Counter-like views.
+    """
+
+    def __init__(self, flush_tokens=Config.COUNT_FLUSH_TOKENS):
+        import numpy as np
+        self.vocab = Vocabulary()
+        self.flush_tokens = flush_tokens
+        self.n_docs = 0
+        self._pending = TokenCorpus(self.vocab)
+        self._counts = np.zeros(0, dtype=np.int64)
+        self._doc_freq = np.zeros(0, dtype=np.int64)
+
+    def add_document(self, tokens):
+        self._pending.add_document(tokens)
+        self.n_docs += 1
+        if self._pending.n_tokens >= self.flush_tokens:
+            self._flush()
+
+    def _grow(self, size):
+        import numpy as np
+        if len(self._counts) < size:
+            capacity = max(size, 2 * len(self._counts))
+            for name in ('_counts', '_doc_freq'):
+                grown = np.zeros(capacity, dtype=np.int64)
+                old = getattr(self, name)
+                grown[:len(old)] = old
+                setattr(self, name, grown)
+
+    def _flush(self):
+        self._grow(len(self.vocab))
+        if len(self._pending):
+            size = len(self._counts)
+            self._counts += self._pending.counts(size)
+            self._doc_freq += self._pending.doc_freq(size)
+            self._pending.clear()
+
+    def merge(self, other):
+        self._flush()
+        other._flush()
+        mapping = self.vocab.remap(other.vocab)
+        self._grow(len(self.vocab))
+        # IDs in mapping are unique, so fancy-index addition does not drop repeats
+        self._counts[mapping] += other._counts[:len(mapping)]
+        self._doc_freq[mapping] += other._doc_freq[:len(mapping)]
+        self.n_docs += other.n_docs
+        return self
+
+    @property
+    def counts(self):
+        self._flush()
+        return TermCounts(self.vocab, self._counts)
+
+    @property
+    def doc_freq(self):
+        self._flush()
+        return TermCounts(self.vocab, self._doc_freq)
+
+    def top(self, n=None, by='count'):
+        if by not in self.METRICS:
+            raise ValueError("Unknown metric {}, expected one of {}".format(by, self.METRICS))
+        self._flush()
+        size = len(self.vocab)
+        ranked = (self._counts if by == 'count' else self._doc_freq)[:size]
+        top = top_indices(ranked, n)
+        top = top[ranked[top] > 0].tolist()
+        counts, doc_freq = self._counts[top].tolist(), self._doc_freq[top].tolist()
+        n_docs = self.n_docs or 1
+        return [(term, count, df / n_docs) for term, count, df in zip(self.vocab.decode(top), counts, doc_freq)]
+
+    def __getstate__(self):
+        self._flush()
+        state = dict(self.__dict__)
+        size = len(self.vocab)
+        state['_counts'], state['_doc_freq'] = self._counts[:size], self._doc_freq[:size]
+        return state
+
+
+def term_statistics(backend=Config.COUNT_BACKEND, shard_dir=None, memory_bytes=None):
+    """
+    :param shard_dir: spill directory of the sharded backend, see ShardedTermStatistics
+    :param memory_bytes: in-memory budget of the sharded backend before it spills
+    """
+    if backend == 'exact':
+        return ArrayTermStatistics()
+    if backend == 'approximate':
+        return ApproximateTermStatistics()
+    if backend == 'sharded':
+        from .shards import ShardedTermStatistics
+        return ShardedTermStatistics(shard_dir, memory_bytes)
+    raise ValueError("Unknown counting backend {}".format(backend))
@@ -0,0 +1,161 @@
+import re
+import zlib
+
+from app_config import Config
+from .instrument import count, stage
+
+WORD = re.compile(r"\w+")
+MAX_HASH = (1 << 32) - 1
+SHINGLE_MULTIPLIER = 0x01000193  # FNV prime, mixes each word's hash into the shingle's
+
+
+def shingles(text, size=Config.DEDUP_SHINGLE_SIZE, word_hashes=None):
+    """
+    :param word_hashes: dict caching each word's hash, shared across texts
+    :return: uint32 array of the distinct hashes of the text's lowercased runs of size words, or of the whole text
+    when it is shorter
+    """
+    import numpy as np
+    word_hashes = {} if word_hashes is None else word_hashes
+    words = WORD.findall(text.lower())
+    hashes = list(map(word_hashes.get, words))
+    if None in hashes:
+        for word in words:
+            if word not in word_hashes:
+                word_hashes[word] = zlib.crc32(word.encode('utf-8'))
+        hashes = list(map(word_hashes.get, words))
+    words = np.array(hashes, dtype=np.uint64)
+    if not len(words):
+        return np.zeros(0, dtype=np.uint32)
+    size = min(size, len(words))
+    # Rolling h = h * multiplier + word over each window, wrapped to 32 bits, one NumPy pass per word position
+    n = len(words) - size + 1
+    shingle = np.zeros(n, dtype=np.uint64)
+    for offset in range(size):
+        shingle = (shingle * np.uint64(SHINGLE_MULTIPLIER) + words[offset:offset + n]) & np.uint64(MAX_HASH)
+    return np.unique(shingle.astype(np.uint32))
+
+
+def lsh_bands(threshold, num_perm):
+    """
+    Bands and rows per band for LSH on num_perm long signatures
+
+    Two documents share a bucket with probability 1 - (1 - s^rows)^bands at Jaccard similarity s, an S-curve that
+    rises steepest near (1 / bands)^(1 / rows), so that is placed as close to the threshold as possible.
+    :return: (bands, rows)
+    """
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        distance = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or distance < best[0]:
+            best = (distance, bands, rows)
+    return best[1], best[2]
+
+
+class MinHasher(object):
+    """
+    MinHash signatures of word shingle sets
+
+    Each of num_perm random multiply-shift hash functions, (a * x + b) >> 32 in wrapping 64-bit arithmetic, stands
+    in for a random permutation of shingle hashes, and the signature keeps each function's minimum. The share of
+    positions where two signatures agree estimates the Jaccard similarity of the shingle sets. Seeded, so signatures
+    from separate runs compare.
+    """
+
+    def __init__(self, num_perm=Config.DEDUP_NUM_PERM, shingle_size=Config.DEDUP_SHINGLE_SIZE, seed=1):
+        import numpy as np
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(0, 1 << 63, size=(num_perm, 1), dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.randint(0, 1 << 63, size=(num_perm, 1), dtype=np.uint64)
+        self.word_hashes = {}
+
+    def signature(self, text):
+        """
+        :return: uint32 array of num_perm minimum hashes, all MAX_HASH for a text without words
+        """
+        import numpy as np
+        hashes = shingles(text, self.shingle_size, self.word_hashes).astype(np.uint64)
+        if not len(hashes):
+            return np.full(self.num_perm, MAX_HASH, dtype=np.uint32)
+        # Array arithmetic wraps silently, which multiply-shift relies on
+        permuted = (self.a * hashes + self.b) >> np.uint64(32)
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def signatures(self, texts):
+        import numpy as np
+        return np.array([self.signature(text) for text in texts], dtype=np.uint32).reshape(-1, self.num_perm)
+
+
+def similarity(first, second):
+    """
+    :return: Jaccard similarity estimated from two MinHash signatures
+    """
+    return float((first == second).mean())
+
+
+class _DisjointSets(object):
+
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, item):
+        parent = self.parent
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, first, second):
+        # The lower index stays the root, so each group is kept as its first document
+        first, second = self.find(first), self.find(second)
+        if first != second:
+            self.parent[max(first, second)] = min(first, second)
+
+
+def find_duplicates(texts, threshold=Config.DEDUP_THRESHOLD, num_perm=Config.DEDUP_NUM_PERM,
+                    shingle_size=Config.DEDUP_SHINGLE_SIZE):
+    """
+    Groups of near-duplicate texts, found with MinHash and LSH banding instead of comparing every pair
+
+    Signatures are cut into bands and texts sharing any band's values become candidates. Each candidate is checked
+    against the first text of its bucket only, so a bucket costs time linear in its size, and groups are joined
+    transitively with union-find. Texts without words are never duplicates.
+    :param threshold: estimated Jaccard similarity of word shingles at or above which texts are duplicates
+    :return: list of groups, each a list of text indices in order, the first being the one to keep
+    """
+    texts = list(texts)
+    with stage('dedup.minhash'):
+        signatures = MinHasher(num_perm, shingle_size).signatures(texts)
+    bands, rows = lsh_bands(threshold, num_perm)
+    sets = _DisjointSets(len(texts))
+    empty = [not WORD.search(text) for text in texts]
+    with stage('dedup.lsh'):
+        for band in range(bands):
+            buckets = {}
+            for index, signature in enumerate(signatures[:, band * rows:(band + 1) * rows]):
+                if not empty[index]:
+                    buckets.setdefault(signature.tobytes(), []).append(index)
+            for members in buckets.values():
+                first = members[0]
+                for index in members[1:]:
+                    if sets.find(index) == sets.find(first):
+                        continue
+                    if similarity(signatures[first], signatures[index]) >= threshold:
+                        sets.union(first, index)
+    groups = {}
+    for index in range(len(texts)):
+        groups.setdefault(sets.find(index), []).append(index)
+    duplicates = [group for group in groups.values() if len(group) > 1]
+    count('dedup.collapsed', sum(len(group) - 1 for group in duplicates))
+    return duplicates
+
+
+def drop_duplicates(texts, groups):
+    """
+    :return: texts without the duplicates in groups, in order
+    """
+    dropped = {index for group in groups for index in group[1:]}
+    return [text for index, text in enumerate(texts) if index not in dropped]
@@ -0,0 +1,144 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from .instrument import count
+
+
+class DiskCache(object):
+    """
+    Size-bounded key/value store in a SQLite file
+
+    Values are bytes with an optional JSON-able dict of metadata. Once the stored values exceed max_bytes the least
+    recently read entries are evicted. Safe to share between threads; separate processes open their own instance.
+    Write failures (e.g. the file being locked by another process for too long) are counted in write_errors and
+    otherwise ignored, as a cache is optional. The first one is reported on stderr.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self.write_errors = 0
+        self._lock = threading.Lock()
+        cache_dir = os.path.dirname(path)
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, meta TEXT, "
+                             "stored_at REAL, accessed_at REAL, size INTEGER)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+
+    def get(self, key):
+        """
+        :return: (value, meta, stored_at) or None
+        """
+        with self._lock:
+            row = self._db.execute("SELECT value, meta, stored_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._write("UPDATE entries SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        value, meta, stored_at = row
+        return bytes(value), json.loads(meta) if meta else {}, stored_at
+
+    def get_many(self, keys):
+        """
+        :return: dict of key -> value for the keys that are cached
+        """
+        found = {}
+        keys = list(keys)
+        with self._lock:
+            for start in range(0, len(keys), 500):  # Stay under SQLite's bound parameter limit
+                batch = keys[start:start + 500]
+                rows = self._db.execute("SELECT key, value FROM entries WHERE key IN ({})".format(
+                    ", ".join("?" * len(batch))), batch).fetchall()
+                found.update((key, bytes(value)) for key, value in rows)
+            if found:
+                now = time.time()
+                self._write_many("UPDATE entries SET accessed_at = ? WHERE key = ?", [(now, key) for key in found])
+        return found
+
+    def put_many(self, items):
+        """
+        :param items: iterable of (key, value)
+        """
+        now = time.time()
+        rows = [(key, sqlite3.Binary(value), None, now, now, len(value)) for key, value in items]
+        with self._lock:
+            self._write_many("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._evict()
+
+    def put(self, key, value, meta=None):
+        now = time.time()
+        with self._lock:
+            self._write("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                        (key, sqlite3.Binary(value), json.dumps(meta) if meta else None, now, now, len(value)))
+            self._evict()
+
+    def touch(self, key):
+        """Marks an entry as freshly stored, e.g. after it was revalidated"""
+        now = time.time()
+        with self._lock:
+            self._write("UPDATE entries SET stored_at = ?, accessed_at = ? WHERE key = ?", (now, now, key))
+
+    def delete(self, key):
+        with self._lock:
+            self._write("DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock:
+            self._write("DELETE FROM entries", ())
+
+    def total_bytes(self):
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+    def _write(self, sql, params):
+        try:
+            with self._db:
+                self._db.execute(sql, params)
+        except sqlite3.Error as e:
+            self._write_failed(e)
+
+    def _write_many(self, sql, rows):
+        try:
+            with self._db:
+                self._db.executemany(sql, rows)
+        except sqlite3.Error as e:
+            self._write_failed(e)
+
+    def _write_failed(self, error):
+        self.write_errors += 1
+        count('diskcache.write_errors')
+        if self.write_errors == 1:
+            print("Could not write to cache {} ({}), carrying on without storing".format(self.path, error),
+                  file=sys.stderr)
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evict = []
+        for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY accessed_at"):
+            if total <= self.max_bytes:
+                break
+            evict.append((key,))
+            total -= size
+        try:
+            with self._db:
+                self._db.executemany("DELETE FROM entries WHERE key = ?", evict)
+        except sqlite3.Error as e:
+            self._write_failed(e)
+            return
+        self.evictions += len(evict)
@@ -0,0 +1,136 @@
+import json
+import threading
+import time
+
+from app_config import Config
+from .diskcache import DiskCache
+from .instrument import count
+
+# Part of every key, bump it when an extractor's output changes without its name changing
+CACHE_VERSION = 1
+
+
+def cache_key(url, extract):
+    """
+    :return: key of the text extract gives for url, so entries of a renamed or versioned extractor are never served
+    """
+    return "{} {}.{} v{}".format(url, extract.__module__, extract.__qualname__, CACHE_VERSION)
+
+
+class ResponseCache(object):
+    """
+    Persistent cache of text extracted from web pages, keyed by URL, extractor and CACHE_VERSION
+
+    Entries younger than ttl are served without a request. Older ones are revalidated with If-None-Match /
+    If-Modified-Since when the server gave an ETag / Last-Modified, and re-extracted only if the page changed.
+    In offline mode cached entries are served regardless of age and anything else is a PageFetchException.
+    """
+
+    def __init__(self, path=Config.HTTP_CACHE_PATH, max_bytes=Config.HTTP_CACHE_MAX_BYTES, ttl=Config.HTTP_CACHE_TTL,
+                 offline=Config.HTTP_CACHE_OFFLINE):
+        self.store = DiskCache(path, max_bytes)
+        self.ttl = ttl
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._lock = threading.Lock()
+
+    def fetch(self, url, extract, request):
+        """
+        :param url: page URL
+        :param extract: function of the response body returning JSON-able text (str, list, ...)
+        :param request: function of a dict of conditional headers (or None) returning a response
+        :return: extracted text
+        """
+        key = cache_key(url, extract)
+        cached, r = self._lookup(url, key, request)
+        if r is None:
+            return cached
+        self._count('misses')
+        text = extract(r.content)
+        self._store(key, text, r)
+        return text
+
+    def iter_fetch(self, url, extract, request):
+        """
+        fetch for an extract that takes an iterator of body chunks and yields pieces of text as they are parsed
+
+        Pieces are passed on as they arrive and stored as a list once the page has been read to the end, so an
+        abandoned read caches nothing.
+        :return: generator of the pieces of text
+        """
+        key = cache_key(url, extract)
+        cached, r = self._lookup(url, key, request)
+        if r is None:
+            yield from cached
+            return
+        self._count('misses')
+        texts = []
+        for text in extract(r.iter_content(Config.FETCH_CHUNK_SIZE)):
+            texts.append(text)
+            yield text
+        self._store(key, texts, r)
+
+    def _lookup(self, url, key, request):
+        """
+        :return: (cached text, None) when the entry is fresh or the page is unchanged, else (None, response) to
+        extract from
+        """
+        entry = self.store.get(key)
+        if entry is not None:
+            value, meta, stored_at = entry
+            if self.offline or time.time() - stored_at < self.ttl:
+                self._count('hits')
+                return json.loads(value.decode('utf-8')), None
+        if self.offline:
+            from .avature import PageFetchException
+            self._count('misses')
+            raise PageFetchException(message="{} is not cached and the cache is offline".format(url), url=url,
+                                     status_code=None)
+
+        headers = {}
+        if entry is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        r = request(headers or None)
+        if r.status_code == 304 and entry is not None:
+            self._count('revalidated')
+            self.store.touch(key)
+            return json.loads(value.decode('utf-8')), None
+        return None, r
+
+    def _store(self, key, text, r):
+        meta = {'etag': r.headers.get('ETag'), 'last_modified': r.headers.get('Last-Modified')}
+        self.store.put(key, json.dumps(text).encode('utf-8'), meta)
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+        count('http_cache.' + name)
+
+    def stats(self):
+        lookups = self.hits + self.revalidated + self.misses
+        return {'hits': self.hits, 'revalidated': self.revalidated, 'misses': self.misses,
+                'evictions': self.store.evictions, 'write_errors': self.store.write_errors, 'entries': len(self.store),
+                'bytes': self.store.total_bytes(),
+                'hit_rate': (self.hits + self.revalidated) / lookups if lookups else 0.0}
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    The process-wide ResponseCache, or None when Config.HTTP_CACHE_ENABLED is off
+    """
+    global _response_cache
+    if not Config.HTTP_CACHE_ENABLED:
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+    return _response_cache
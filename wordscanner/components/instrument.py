@@ -0,0 +1,200 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+from app_config import Config
+
+
+class _NullStage(object):
+    # Handed out while instrumentation is off, so a disabled stage costs one attribute check and no allocation
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_STAGE = _NullStage()
+
+
+class _Stage(object):
+    __slots__ = ('instruments', 'name', 'start', 'profiling')
+
+    def __init__(self, instruments, name):
+        self.instruments = instruments
+        self.name = name
+        self.profiling = False
+
+    def __enter__(self):
+        self.profiling = self.instruments._start_profile(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        if self.profiling:
+            self.instruments._stop_profile()
+        self.instruments._record(self.name, self.start, end)
+        return False
+
+
+class Instrumentation(object):
+    """
+    Per-stage timers and counters for a run
+
+    Off by default. While off, stage() returns a shared no-op context manager and count() returns immediately.
+    Stage times are summed over every call, including calls in cleaning workers, so nested stages and stages run in
+    parallel add up to more than the wall time. Stages listed in profile_stages also run under cProfile.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.trace = False
+        self.profile_stages = frozenset()
+        self.profiler = None
+        self._profile_depth = 0  # Profiled stages entered and not yet exited, the outermost one owns the profiler
+        self.max_events = Config.TRACE_MAX_EVENTS
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.timings = {}  # stage -> [calls, seconds]
+        self.counters = Counter()
+        self.events = []
+        self.dropped_events = 0
+        self.started = time.perf_counter()
+
+    def enable(self, trace=False, profile_stages=()):
+        """
+        :param trace: also keep each stage call as an event for the JSON trace
+        :param profile_stages: stage names to run under cProfile
+        """
+        self.enabled = True
+        self.trace = trace
+        self.profile_stages = frozenset(profile_stages)
+        if self.profile_stages and self.profiler is None:
+            import cProfile
+            self.profiler = cProfile.Profile()
+        self.reset()
+
+    def disable(self):
+        self.enabled = False
+
+    def stage(self, name):
+        if not self.enabled:
+            return NULL_STAGE
+        return _Stage(self, name)
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] += n
+
+    def _record(self, name, start, end):
+        with self._lock:
+            timing = self.timings.get(name)
+            if timing is None:
+                timing = self.timings[name] = [0, 0.0]
+            timing[0] += 1
+            timing[1] += end - start
+            if self.trace:
+                if len(self.events) < self.max_events:
+                    self.events.append((name, start, end - start, os.getpid(), threading.get_ident()))
+                else:
+                    self.dropped_events += 1
+
+    def _start_profile(self, name):
+        if self.profiler is None or name not in self.profile_stages:
+            return False
+        with self._lock:
+            if not self._profile_depth:
+                try:
+                    self.profiler.enable()
+                except ValueError:  # Another profiler is already active in this interpreter
+                    return False
+            self._profile_depth += 1
+        return True
+
+    def _stop_profile(self):
+        with self._lock:
+            self._profile_depth -= 1
+            if not self._profile_depth:
+                self.profiler.disable()
+
+    def snapshot(self):
+        """
+        Timings, counters and events recorded so far, as plain values that can be sent between processes
+        """
+        return {'timings': {name: list(timing) for name, timing in self.timings.items()},
+                'counters': dict(self.counters), 'events': list(self.events), 'dropped_events': self.dropped_events}
+
+    def drain(self):
+        with self._lock:
+            snapshot = self.snapshot()
+            self.timings, self.counters, self.events, self.dropped_events = {}, Counter(), [], 0
+        return snapshot
+
+    def merge(self, snapshot):
+        """
+        Adds a snapshot from another process, e.g. a cleaning worker
+        """
+        if not snapshot:
+            return
+        with self._lock:
+            for name, (calls, seconds) in snapshot['timings'].items():
+                timing = self.timings.setdefault(name, [0, 0.0])
+                timing[0] += calls
+                timing[1] += seconds
+            self.counters.update(snapshot['counters'])
+            room = max(self.max_events - len(self.events), 0)
+            self.events.extend(snapshot['events'][:room])
+            self.dropped_events += snapshot['dropped_events'] + max(len(snapshot['events']) - room, 0)
+
+    def summary(self):
+        """
+        :return: report of stage times, slowest first, then counters
+        """
+        wall = time.perf_counter() - self.started
+        lines = ["{:<28} {:>8} {:>10} {:>10}".format('stage', 'calls', 'seconds', 'ms/call')]
+        for name, (calls, seconds) in sorted(self.timings.items(), key=lambda item: item[1][1], reverse=True):
+            lines.append("{:<28} {:>8} {:>10.3f} {:>10.3f}".format(name, calls, seconds, seconds * 1000 / calls))
+        lines.append("{:<28} {:>8} {:>10.3f}".format('wall time', '', wall))
+        if self.counters:
+            lines.append("")
+            lines.extend("{:<28} {:>8}".format(name, value) for name, value in sorted(self.counters.items()))
+        return "\n".join(lines)
+
+    def to_json(self):
+        """
+        Stage totals and counters, plus stage calls in Chrome trace event format when tracing
+        (open in chrome://tracing or Perfetto)
+        """
+        report = {'wall_seconds': time.perf_counter() - self.started,
+                  'stages': {name: {'calls': calls, 'seconds': seconds}
+                             for name, (calls, seconds) in self.timings.items()},
+                  'counters': dict(self.counters)}
+        if self.trace:
+            report['traceEvents'] = [{'name': name, 'ph': 'X', 'ts': (start - self.started) * 1e6,
+                                      'dur': duration * 1e6, 'pid': pid, 'tid': tid}
+                                     for name, start, duration, pid, tid in self.events]
+            report['dropped_events'] = self.dropped_events
+        return report
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_json(), f, indent=1)
+
+    def write_profile(self, path):
+        """
+        Saves cProfile stats of the profiled stages, readable with pstats or snakeviz
+        """
+        if self.profiler is not None:
+            self.profiler.dump_stats(path)
+
+
+INSTRUMENTS = Instrumentation()
+stage = INSTRUMENTS.stage
+count = INSTRUMENTS.count
@@ -1,20 +1,86 @@
-from rake_nltk import Rake
-import pickle
+import heapq
+from collections import Counter
+
 from app_config import Config
+from .instrument import count, stage
+from .models import REGISTRY
+from .preprocessing import load_nltk
 
 
 class KeywordExtractionMixin(object):
 
     def __init__(self):
+        load_nltk()
+        from rake_nltk import Rake
         self.kw_finder = Rake()
 
     def extract_kw(self, text, scores=True):
-        self.kw_finder.extract_keywords_from_text(text)
+        with stage('rake'):
+            self.kw_finder.extract_keywords_from_text(text)
+        count('documents')
         if scores:
             return self.kw_finder.get_ranked_phrases_with_scores()
         else:
             return self.kw_finder.get_ranked_phrases()
 
+    def extract_document(self, text):
+        """
+        Runs Rake on one document
+
+        :return: (word frequencies, word degrees, [(score, phrase)] with repeated phrases dropped)
+        """
+        with stage('rake'):
+            self.kw_finder.extract_keywords_from_text(text)
+        count('documents')
+        ranked, seen = [], set()
+        for score, phrase in self.kw_finder.get_ranked_phrases_with_scores():
+            if phrase not in seen:
+                seen.add(phrase)
+                ranked.append((score, phrase))
+        return (Counter(self.kw_finder.get_word_frequency_distribution()),
+                Counter(self.kw_finder.get_word_degrees()), ranked)
+
+
+class KeywordStatistics(object):
+    """
+    Rake word statistics summed over documents
+
+    Each document is split into candidate phrases on its own, so phrases never span two documents. A phrase's corpus
+    score is the sum over its words of degree / frequency, with both summed across every document.
+    """
+
+    def __init__(self):
+        self.frequency = Counter()
+        self.degree = Counter()
+        self.phrases = Counter()  # Documents each phrase was a candidate in
+        self.n_docs = 0
+
+    def add_document(self, frequency, degree, ranked):
+        self.frequency.update(frequency)
+        self.degree.update(degree)
+        self.phrases.update(phrase for _, phrase in ranked)
+        self.n_docs += 1
+
+    def merge(self, other):
+        self.frequency.update(other.frequency)
+        self.degree.update(other.degree)
+        self.phrases.update(other.phrases)
+        self.n_docs += other.n_docs
+        return self
+
+    def score(self, phrase):
+        frequency, degree = self.frequency, self.degree
+        return sum(degree[word] / frequency[word] for word in phrase.split(" ") if frequency[word])
+
+    def top(self, n=None):
+        """
+        :return: [(score, phrase)], highest first, all phrases when n is None
+        """
+        scored = ((self.score(phrase), phrase) for phrase in self.phrases)
+        if n is None:
+            return sorted(scored, reverse=True)
+        return heapq.nlargest(n, scored)
+
 
 class SkillExtractionMixin(object):
 
@@ -22,7 +88,11 @@ class SkillExtractionMixin(object):
         self._load_skills(skills_fp)
 
     def _load_skills(self, skills_fp):
-        with open(skills_fp, 'rb') as pickle_file:
-            skills_counts = pickle.load(pickle_file)
-            self.skills_counts = skills_counts
-            self.skills_set = set(list(skills_counts.keys()))
+        # Shared with every other SkillSearch in this process, do not modify
+        self.skill_matcher = REGISTRY.get('skill_matcher', skills_fp)
+        self.skills_counts = self.skill_matcher.counts
+        self.skills_set = self.skill_matcher.skills_set
+
+    def match_skills(self, tokens):
+        with stage('skills.match'):
+            return self.skill_matcher.count(tokens)
@@ -0,0 +1,111 @@
+import os
+import pickle
+import threading
+
+from app_config import Config
+
+
+def load_phraser(path):
+    from gensim.models.phrases import Phraser
+    return Phraser.load(path, mmap='r')
+
+
+def load_compiled_phraser(path):
+    from .phrasing import CompiledPhraser
+    return CompiledPhraser.from_gensim(REGISTRY.get('phraser', path))
+
+
+def load_skills(path):
+    """
+    :return: (skill -> occurrence count dict, frozenset of skills)
+    """
+    with open(path, 'rb') as pickle_file:
+        skills_counts = pickle.load(pickle_file)
+    return skills_counts, frozenset(skills_counts.keys())
+
+
+def load_skill_matcher(path, compiled_path=Config.SKILL_MATCHER_PATH):
+    """
+    SkillMatcher for the skills table at path, read from its compiled form when that is up to date
+
+    The compiled form is keyed by the table's file signature and by the stopwords and Tokenizer settings that clean
+    skill names, so changing either rebuilds it.
+    """
+    from .preprocessing import TOKENIZER
+    from .skills import SkillMatcher, file_signature
+    from .token_cache import cleaning_fingerprint
+    signature = (file_signature(path), cleaning_fingerprint('skills', False, False, None, TOKENIZER.stopwords,
+                                                            TOKENIZER.min_length))
+    try:
+        matcher = SkillMatcher.load(compiled_path, signature)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        matcher = None
+    if matcher is None:
+        skills_counts, _ = load_skills(path)
+        matcher = SkillMatcher(skills_counts)
+        try:
+            os.makedirs(os.path.dirname(compiled_path), exist_ok=True)
+            matcher.save(compiled_path, signature)
+        except OSError:
+            pass
+    return matcher
+
+
+def load_tfidf(path):
+    from gensim.models import TfidfModel
+    return TfidfModel.load(path, mmap='r')
+
+
+def load_tfidf_scorer(path):
+    from .tfidf import TfidfScorer
+    return TfidfScorer(REGISTRY.get('tfidf', path))
+
+
+class ModelRegistry(object):
+    """
+    Loads each model once per process and hands the same instance to every caller
+
+    Models are shared, so callers must treat them as read-only. gensim models are loaded with mmap='r', which only
+    affects NumPy arrays saved to separate .npy files next to the model. Those are mapped read-only from disk and
+    their pages are shared by every process that maps them. The rest of a model, including the Phraser's phrase
+    dict and the TF-IDF model's IDFs and dictionary, is unpickled into each process's own memory. Workers forked
+    after a model is loaded inherit it copy-on-write, and workers started with spawn load it again.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._default_paths = {}
+        self._models = {}
+        self._lock = threading.RLock()  # Loaders may get the models they are built from
+
+    def register(self, name, loader, default_path=None):
+        self._loaders[name] = loader
+        self._default_paths[name] = default_path
+
+    def get(self, name, path=None):
+        path = path or self._default_paths[name]
+        key = (name, path)
+        with self._lock:
+            if key not in self._models:
+                self._models[key] = self._loaders[name](path)
+            return self._models[key]
+
+    def preload(self, *names):
+        for name in names:
+            self.get(name)
+
+    def loaded(self):
+        return sorted(self._models)
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+
+REGISTRY = ModelRegistry()
+REGISTRY.register('phraser', load_phraser, Config.PHRASER_PATH)
+REGISTRY.register('compiled_phraser', load_compiled_phraser, Config.PHRASER_PATH)
+REGISTRY.register('skills', load_skills, Config.SKILLS_PATH)
+REGISTRY.register('skill_matcher', load_skill_matcher, Config.SKILLS_PATH)
+REGISTRY.register('tfidf', load_tfidf, Config.TFIDF_PATH)
+REGISTRY.register('tfidf_scorer', load_tfidf_scorer, Config.TFIDF_PATH)
@@ -0,0 +1,257 @@
+import multiprocessing
+from collections import deque
+from itertools import chain, islice
+
+from app_config import Config
+from .counting import term_statistics
+from .instrument import INSTRUMENTS, stage
+from .keywords import KeywordExtractionMixin, KeywordStatistics
+from .preprocessing import WordCleanerMixin
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def serial_or_pooled(docs, workers, chunk_size):
+    """
+    Whether docs are better handled in this process than by a pool: with one worker, or when they fit in one chunk
+
+    Iterators and streams are peeked for chunk_size + 1 documents, so a short stream never pays for starting a pool.
+    :return: (docs, serial), docs to be used instead of the ones passed in as the peeked ones were consumed
+    """
+    if workers <= 1:
+        return docs, True
+    if isinstance(docs, (list, tuple)):
+        return docs, len(docs) <= chunk_size
+    iterator = iter(docs)
+    head = list(islice(iterator, chunk_size + 1))
+    if len(head) <= chunk_size:
+        return head, True
+    return chain(head, iterator), False
+
+
+def imap_chunks(func, chunks, workers, initializer=None, initargs=()):
+    """
+    Ordered, bounded map of func over chunks in a process pool
+
+    At most 2 * workers chunks are in flight, so chunks can be a lazy stream of any length. Stage timings and
+    counters recorded in the workers are merged into this process's INSTRUMENTS.
+    :param func: picklable function applied to each chunk inside a worker
+    :param chunks: iterable of chunks
+    :param workers: number of processes
+    :param initializer: run once in each worker, e.g. to load models
+    :return: generator of func(chunk) in the order chunks were given
+    """
+    instrument = ('trace' if INSTRUMENTS.trace else 'time') if INSTRUMENTS.enabled else None
+    pool = multiprocessing.Pool(workers, _init_pool, (instrument, initializer, initargs))
+    try:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(_call_instrumented, (func, chunk)))
+            if len(pending) >= workers * 2:
+                yield _collect(pending.popleft().get())
+        while pending:
+            yield _collect(pending.popleft().get())
+    except BaseException:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+
+
+def _init_pool(instrument, initializer, initargs):
+    # Forked workers inherit the parent's timings, start them from zero so they are not sent back twice
+    if instrument:
+        INSTRUMENTS.enable(trace=instrument == 'trace')
+    else:
+        INSTRUMENTS.disable()
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _call_instrumented(func, chunk):
+    result = func(chunk)
+    return result, INSTRUMENTS.drain() if INSTRUMENTS.enabled else None
+
+
+def _collect(result):
+    result, snapshot = result
+    INSTRUMENTS.merge(snapshot)
+    return result
+
+
+def count_documents(cleaner, docs, analyzer=None, backend=Config.COUNT_BACKEND, shard_dir=None, memory_bytes=None):
+    """
+    Cleans docs and counts terms without keeping token lists
+
+    :param analyzer: optional function mapping a document's tokens to the terms to count, e.g. a SkillMatcher
+    :param backend: 'exact', 'approximate' or 'sharded', see counting.term_statistics
+    :param shard_dir: spill directory of the sharded backend
+    :param memory_bytes: in-memory budget of the sharded backend before it spills
+    :return: TermStatistics
+    """
+    stats = term_statistics(backend, shard_dir, memory_bytes)
+    for tokens in cleaner.clean_many(docs):
+        with stage('count'):
+            stats.add_document(analyzer(tokens) if analyzer else tokens)
+    return stats
+
+
+_worker_cleaner = None
+_worker_analyzer = None
+_worker_backend = None
+_worker_shard_dir = None
+_worker_memory_bytes = None
+
+
+def _init_worker(stem, lemma, phrases, analyzer, backend, shard_dir, memory_bytes):
+    # Stopwords, WordNet, the Phraser and the analyzer are loaded once per worker process, not per chunk
+    global _worker_cleaner, _worker_analyzer, _worker_backend, _worker_shard_dir, _worker_memory_bytes
+    _worker_cleaner = WordCleanerMixin(stem, lemma, phrases)
+    _worker_analyzer = analyzer
+    _worker_backend = backend
+    _worker_shard_dir = shard_dir
+    _worker_memory_bytes = memory_bytes
+
+
+def _count_chunk(docs):
+    return count_documents(_worker_cleaner, docs, _worker_analyzer, _worker_backend, _worker_shard_dir,
+                           _worker_memory_bytes)
+
+
+def _clean_chunk(docs):
+    return list(_worker_cleaner.clean_many(docs))
+
+
+class CleaningExecutor(object):
+    """
+    Cleans and counts many documents, sharded across worker processes in chunks
+
+    Workers send back TermStatistics rather than token lists, and these are merged in chunk order so results do not
+    depend on scheduling. Falls back to cleaning in this process with a single worker or a single chunk.
+    :param cleaner: a WordCleanerMixin whose stem, lemma and phrases settings are used
+    :param analyzer: optional picklable function mapping each document's tokens to the terms to count
+    :param backend: 'exact', 'approximate' to count in fixed memory, or 'sharded' to spill counts to disk; approximate
+    summaries and shards merge across workers. Defaults to Config.COUNT_BACKEND at the time the executor is created
+    :param shard_dir: spill directory of the sharded backend, defaults to Config.SHARD_DIR at the same time
+    :param memory_bytes: per-process in-memory budget of the sharded backend, defaults to Config.SHARD_MEMORY_BYTES
+    """
+
+    def __init__(self, cleaner, workers=Config.CLEAN_WORKERS, chunk_size=Config.CLEAN_CHUNK_SIZE, analyzer=None,
+                 backend=None, shard_dir=None, memory_bytes=None):
+        self.cleaner = cleaner
+        self.analyzer = analyzer
+        self.backend = backend or Config.COUNT_BACKEND
+        # Resolved here and sent to workers, which may be spawned with the import-time Config
+        self.shard_dir = shard_dir or Config.SHARD_DIR
+        self.memory_bytes = memory_bytes or Config.SHARD_MEMORY_BYTES
+        self.workers = workers
+        self.chunk_size = chunk_size
+
+    def _map(self, func, docs):
+        use_phrases = self.cleaner.phrases is not False and self.cleaner.phrases is not None
+        return imap_chunks(func, chunked(docs, self.chunk_size), self.workers, initializer=_init_worker,
+                           initargs=(self.cleaner.stem, self.cleaner.lemma, use_phrases, self.analyzer, self.backend,
+                                     self.shard_dir, self.memory_bytes))
+
+    def clean(self, docs):
+        """
+        :return: generator of each document's tokens, in order, for callers that need more than counts
+        """
+        docs, serial = serial_or_pooled(docs, self.workers, self.chunk_size)
+        if serial:
+            for tokens in self.cleaner.clean_many(docs):
+                yield tokens
+            return
+        for chunk in self._map(_clean_chunk, docs):
+            for tokens in chunk:
+                yield tokens
+
+    def count(self, docs):
+        docs, serial = serial_or_pooled(docs, self.workers, self.chunk_size)
+        if serial:
+            return count_documents(self.cleaner, docs, self.analyzer, self.backend, self.shard_dir, self.memory_bytes)
+
+        results = self._map(_count_chunk, docs)
+        stats = term_statistics(self.backend, self.shard_dir, self.memory_bytes)
+        for chunk_stats in results:
+            with stage('count.merge'):
+                stats.merge(chunk_stats)
+        return stats
+
+
+_worker_extractor = None
+_worker_doc_topn = None
+
+
+def _init_keyword_worker(doc_topn):
+    # Rake and its stopwords are built once per worker process
+    global _worker_extractor, _worker_doc_topn
+    _worker_extractor = KeywordExtractionMixin()
+    _worker_doc_topn = doc_topn
+
+
+def extract_documents(extractor, docs, doc_topn=None):
+    """
+    :return: (KeywordStatistics of docs, list of each document's [(score, phrase)], cut to doc_topn)
+    """
+    stats, rankings = KeywordStatistics(), []
+    for doc in docs:
+        frequency, degree, ranked = extractor.extract_document(doc)
+        stats.add_document(frequency, degree, ranked)
+        rankings.append(ranked[:doc_topn] if doc_topn is not None else ranked)
+    return stats, rankings
+
+
+def _extract_chunk(docs):
+    return extract_documents(_worker_extractor, docs, _worker_doc_topn)
+
+
+class KeywordExecutor(object):
+    """
+    Runs Rake over many documents independently, sharded across worker processes in chunks
+
+    Workers send back each chunk's KeywordStatistics and per-document rankings, merged in chunk order. Falls back to
+    the extractor in this process with a single worker or a single chunk.
+    :param extractor: a KeywordExtractionMixin
+    :param doc_topn: phrases kept per document, all when None
+    """
+
+    def __init__(self, extractor, workers=Config.CLEAN_WORKERS, chunk_size=Config.CLEAN_CHUNK_SIZE, doc_topn=None):
+        self.extractor = extractor
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.doc_topn = doc_topn
+        self.stats = KeywordStatistics()
+
+    def extract(self, docs):
+        """
+        :return: generator of each document's ranked phrases, in order; corpus totals accumulate in self.stats
+        """
+        docs, serial = serial_or_pooled(docs, self.workers, self.chunk_size)
+        if serial:
+            results = (extract_documents(self.extractor, chunk, self.doc_topn)
+                       for chunk in chunked(docs, self.chunk_size))
+        else:
+            results = imap_chunks(_extract_chunk, chunked(docs, self.chunk_size), self.workers,
+                                  initializer=_init_keyword_worker, initargs=(self.doc_topn,))
+        for chunk_stats, rankings in results:
+            self.stats.merge(chunk_stats)
+            for ranked in rankings:
+                yield ranked
+
+    def rank(self, docs, topn=None):
+        """
+        :return: corpus ranking [(score, phrase)]
+        """
+        for _ in self.extract(docs):
+            pass
+        return self.stats.top(topn)
@@ -0,0 +1,102 @@
+def _to_str(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+class CompiledPhraser(object):
+    """
+    Frozen phrase table compiled once from a gensim Phraser, with the same output as the Phraser
+
+    Only phrases scoring above the threshold are kept, so applying it is one dict lookup per candidate instead of a
+    lookup and a score comparison. Candidates whose first token cannot start any phrase, most of them, are skipped
+    without building a key. Connector words (gensim 3 common_terms) are handled exactly as gensim does: they may sit
+    inside a phrase but never start or end one.
+    Accepts gensim 4 phrasegrams ('a_b' -> score) and gensim 3 ones ((b'a', b'b') -> (count, score)).
+    Indexing works like a Phraser: phraser[tokens] for one token list, phraser[token_lists] for a batch.
+    """
+
+    def __init__(self, phrasegrams, threshold, connector_words=(), delimiter='_'):
+        self.delimiter = _to_str(delimiter)
+        self.connector_words = frozenset(connector_words)
+        self.phrases = {}
+        for key, score in phrasegrams.items():
+            if isinstance(score, tuple):  # gensim 3: (count, score)
+                score = score[-1]
+            if not score > threshold:
+                continue
+            if isinstance(key, tuple):  # gensim 3: tuple of utf-8 components
+                key = self.delimiter.join(_to_str(part) for part in key)
+            self.phrases[key] = key
+        # Every prefix ending at a delimiter, so tokens that themselves contain the delimiter are never ruled out
+        self.starts = set()
+        for phrase in self.phrases:
+            parts = phrase.split(self.delimiter)
+            for end in range(1, len(parts)):
+                self.starts.add(self.delimiter.join(parts[:end]))
+
+    @classmethod
+    def from_gensim(cls, model):
+        """
+        :param model: gensim Phraser / FrozenPhrases, or Phrases
+        """
+        if hasattr(model, 'freeze'):  # gensim 4 Phrases, phrasegrams are computed on freezing
+            model = model.freeze()
+        connectors = getattr(model, 'connector_words', None)
+        if connectors is None:
+            # gensim 3 compares utf-8 encoded tokens against common_terms, so decoded they match the same tokens.
+            # gensim 4 compares str tokens as they are, which is kept: models converted from gensim 3 carry bytes
+            # connector_words that never match
+            connectors = [_to_str(word) for word in getattr(model, 'common_terms', ())]
+        return cls(model.phrasegrams, model.threshold, connectors, getattr(model, 'delimiter', '_'))
+
+    def apply(self, tokens):
+        """
+        :return: list of tokens with detected phrases joined by the delimiter
+        """
+        connectors, starts, phrases, delimiter = self.connector_words, self.starts, self.phrases, self.delimiter
+        out = []
+        start, in_between = None, []
+        # Truth tests on start, not `is None`, as gensim does
+        for word in tokens:
+            if word in connectors:
+                if start:
+                    in_between.append(word)
+                else:
+                    out.append(word)
+                continue
+            if start:
+                phrase = None
+                if start in starts:
+                    if in_between:
+                        phrase = phrases.get(delimiter.join([start] + in_between + [word]))
+                    else:
+                        phrase = phrases.get(start + delimiter + word)
+                if phrase is not None:
+                    out.append(phrase)
+                    start, in_between = None, []
+                    continue
+                out.append(start)
+                if in_between:
+                    out.extend(in_between)
+                    in_between = []
+            start = word
+        if start:
+            out.append(start)
+            out.extend(in_between)
+        return out
+
+    def apply_many(self, token_lists):
+        """
+        :return: generator of apply() over each token list
+        """
+        apply = self.apply
+        for tokens in token_lists:
+            yield apply(tokens)
+
+    def __getitem__(self, tokens):
+        # Same dispatch as gensim: a list whose first item is a str is one sentence, otherwise a batch of them
+        if isinstance(tokens, str):
+            raise TypeError("CompiledPhraser expects a list of tokens, not a str")
+        tokens = tokens if isinstance(tokens, (list, tuple)) else list(tokens)
+        if not tokens or isinstance(tokens[0], str):
+            return self.apply(tokens)
+        return self.apply_many(tokens)
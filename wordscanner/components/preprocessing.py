@@ -1,19 +1,49 @@
 import re
-import nltk
-nltk.data.path.append(r"wordscanner/nltk_data_folder")
-from nltk.corpus import wordnet as wn
-from nltk.corpus import stopwords as sw
-from nltk import wordpunct_tokenize
-from nltk import WordNetLemmatizer
-from nltk import sent_tokenize
-from nltk import pos_tag
-from nltk.stem.porter import PorterStemmer
 import string
-from gensim.models.phrases import Phraser
+from collections import OrderedDict
+from itertools import islice
 from app_config import Config
+from .instrument import count, stage
+from .models import REGISTRY
+from .token_cache import cleaning_fingerprint, get_token_cache
 
+# NLTK and gensim take most of a second to import, so they are imported on first use rather than with this module
+NLTK_DATA_PATH = r"wordscanner/nltk_data_folder"
 
-STOPWORDS = frozenset([
+
+def load_nltk():
+    import nltk
+    if NLTK_DATA_PATH not in nltk.data.path:
+        nltk.data.path.append(NLTK_DATA_PATH)
+    return nltk
+
+
+class LazyStopwords(object):
+    """
+    Stopword set completed with NLTK's stopword list the first time it is used
+    """
+
+    def __init__(self, words, language='english'):
+        self.base_words = frozenset(words)
+        self.language = language
+        self._words = None
+
+    def load(self):
+        if self._words is None:
+            self._words = self.base_words | frozenset(load_nltk().corpus.stopwords.words(self.language))
+        return self._words
+
+    def __contains__(self, word):
+        return word in self.load()
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self):
+        return len(self.load())
+
+
+STOPWORDS = LazyStopwords([
     'all', 'six', 'just', 'less', 'being', 'indeed', 'over', 'move', 'anyway', 'four', 'not', 'own', 'through',
     'using', 'fify', 'where', 'mill', 'only', 'find', 'before', 'one', 'whose', 'system', 'how', 'somewhere',
     'much', 'thick', 'show', 'had', 'enough', 'should', 'to', 'must', 'whom', 'seeming', 'yourselves', 'under',
@@ -42,7 +72,7 @@ STOPWORDS = frozenset([
     'eight', 'but', 'serious', 'nothing', 'such', 'why', 'off', 'a', 'don', 'whereby', 'third', 'i', 'whole', 'noone',
     'sometimes', 'well', 'amoungst', 'yours', 'their', 'rather', 'without', 'so', 'five', 'the', 'first', 'with',
     'make', 'once', 'data', 'development', 'web', 'applications', 'developed', 'experience', 'summary', 'description'
-] + sw.words('english'))
+])
 
 RE_PUNCT = re.compile(r'([%s])+' % re.escape(string.punctuation), re.UNICODE)
 RE_TAGS = re.compile(r"<([^>]+)>", re.UNICODE)
@@ -60,106 +90,372 @@ FILTERS = [lambda x: x.lower(),
            lambda x: " ".join([word for word in x.split() if word not in STOPWORDS]),
            lambda x: " ".join([word for word in x.split() if len(word)>=3])]
 
+RE_SPLIT = re.compile(r'[\s%s]+' % re.escape(string.punctuation), re.UNICODE)
+STRIP_DIGITS = str.maketrans('', '', '0123456789')
 
-def preprocess_string(s, filters=FILTERS, lemma=False, stem=False, phrases=False):
-    if lemma:
-        s = _tokenize(s)
+
+class Tokenizer(object):
+    """
+    Single pass equivalent of FILTERS
+
+    Lowercases, strips tags, splits on punctuation and whitespace, removes digits and drops stopwords and
+    short tokens, yielding the same tokens as running FILTERS and splitting the result.
+    Can be passed as `filters` wherever a FILTERS list is accepted.
+    """
+
+    def __init__(self, stopwords=STOPWORDS, min_length=3):
+        self.stopwords = stopwords
+        self.min_length = max(min_length, 1)
+
+    def tokenize(self, s):
+        s = s.lower()
+        if '<' in s:
+            s = RE_TAGS.sub("", s)
+        stopwords, min_length = self.stopwords, self.min_length
+        if isinstance(stopwords, LazyStopwords):
+            stopwords = stopwords.load()
+        return [token for token in (word.translate(STRIP_DIGITS) for word in RE_SPLIT.split(s))
+                if len(token) >= min_length and token not in stopwords]
+
+    def __call__(self, s):
+        return " ".join(self.tokenize(s))
+
+
+TOKENIZER = Tokenizer()
+
+
+def apply_filters(s, filters=TOKENIZER):
+    """
+    Runs `filters` over s and returns a list of tokens
+
+    :param s: text to filter
+    :param filters: a Tokenizer or a list of str -> str callables, such as FILTERS
+    :return: list of tokens
+    """
+    if isinstance(filters, Tokenizer):
+        return filters.tokenize(s)
     for f in filters:
         s = f(s)
-    if stem:
-        stemmer = PorterStemmer()
-        s = " ".join([stemmer.stem(word) for word in s.split()])
-    if phrases is not False and phrases is not None:
-        s = " ".join(phrases[s.split()])
     return s.split()
 
 
-def preprocess_string_to_sentences(s, filters=FILTERS, lemma=False, stem=False, phrases=False):
+def preprocess_string(s, filters=TOKENIZER, lemma=False, stem=False, phrases=False):
     if lemma:
-        sentences = _tokenize(s, as_sentences=True)
-    else:
-        sentences = sent_tokenize(s)
+        s = _tokenize(s)
+    with stage('tokenize'):
+        tokens = apply_filters(s, filters)
+    if stem:
+        with stage('stem'):
+            stemmer = load_nltk().PorterStemmer()
+            tokens = [stemmer.stem(word) for word in tokens]
+    if phrases is not False and phrases is not None:
+        with stage('phrases'):
+            tokens = list(phrases[tokens])
+    count('documents')
+    count('tokens', len(tokens))
+    return tokens
 
-    def text_filter(sentence):
-        for f in filters:
-            sentence = f(sentence)
-        return sentence
 
-    def stem_text(text):
-        stem_sent = " ".join([stemmer.stem(word) for word in text.split()])
-        return stem_sent
+def preprocess_documents(docs, filters=TOKENIZER, lemma=False, stem=False, phrases=False):
+    """
+    preprocess_string over many documents, POS tagging them in batches when lemmatizing
 
-    def phrase_text(text):
-        phrased_sent = " ".join(phrases[text.split()])
-        return phrased_sent
+    :return: generator of token lists, one per document, in input order
+    """
+    if lemma:
+        docs = _tokenize_many(docs)
+    for doc in docs:
+        yield preprocess_string(doc, filters=filters, lemma=False, stem=stem, phrases=phrases)
 
-    sentences = map(text_filter, sentences)
 
-    if stem:
-        stemmer = PorterStemmer()
-        sentences = map(stem_text, sentences)
+def preprocess_string_to_sentences(s, filters=TOKENIZER, lemma=False, stem=False, phrases=False):
+    return list(iter_clean_sentences(s, filters=filters, lemma=lemma, stem=stem, phrases=phrases))
 
-    if phrases is not False and phrases is not None:
-        sentences = map(phrase_text, sentences)
 
-    return list(sentences)
+def iter_text_chunks(text, chunk_size=Config.SENTENCE_CHUNK_SIZE):
+    """
+    :param text: a str, or an iterable of str pieces of one text such as an open file
+    :return: generator of str pieces of at most chunk_size characters from a str, or the pieces as given
+    """
+    if isinstance(text, str):
+        for start in range(0, len(text), chunk_size):
+            yield text[start:start + chunk_size]
+    else:
+        yield from text
+
+
+def iter_sentences(text, chunk_size=Config.SENTENCE_CHUNK_SIZE, max_chars=Config.SENTENCE_MAX_CHARS):
+    """
+    sent_tokenize over text of any length, a chunk at a time
+
+    The last sentence found in each chunk may be incomplete, so its raw text is carried into the next chunk and only
+    yielded once a later boundary is found. A carried sentence longer than max_chars is yielded as it is, keeping
+    memory bounded on text without sentence boundaries. Text no longer than chunk_size is split exactly as
+    sent_tokenize would.
+    :param text: a str, or an iterable of str pieces of one text
+    :return: generator of sentences
+    """
+    nltk = load_nltk()
+    carry = ""
+    for chunk in iter_text_chunks(text, chunk_size):
+        buffer = carry + chunk
+        with stage('sent_tokenize'):
+            sentences = nltk.sent_tokenize(buffer)
+        if not sentences:
+            carry = buffer
+            continue
+        # Keep the last sentence's raw text, trailing whitespace included, so the next chunk joins it correctly
+        start = buffer.rfind(sentences[-1])
+        carry = buffer[start:] if start >= 0 else sentences[-1] + " "
+        yield from sentences[:-1]
+        if len(carry) > max_chars:
+            yield carry.strip()
+            carry = ""
+    if carry.strip():
+        yield carry.strip()
+
+
+def iter_clean_sentences(text, filters=TOKENIZER, lemma=False, stem=False, phrases=False,
+                         batch_size=Config.SENTENCE_BATCH_SIZE, chunk_size=Config.SENTENCE_CHUNK_SIZE):
+    """
+    Streams cleaned sentences of text, each a str of space separated tokens
+
+    Sentences are cleaned batch_size at a time: POS tagged together when lemmatizing, and passed to the Phraser as
+    one corpus. Memory is bounded by one text chunk and one batch, however long text is.
+    :param text: a str, or an iterable of str pieces of one text such as an open file
+    :param phrases: a loaded Phraser, or False
+    :return: generator of cleaned sentences, one per sentence found, in order
+    """
+    sentences = iter_sentences(text, chunk_size)
+    while True:
+        batch = list(islice(sentences, batch_size))
+        if not batch:
+            return
+        yield from _clean_sentence_batch(batch, filters, lemma, stem, phrases)
+
+
+def _clean_sentence_batch(sentences, filters, lemma, stem, phrases):
+    if lemma:
+        nltk = load_nltk()
+        with stage('pos_tag'):
+            tagged = nltk.pos_tag_sents([nltk.wordpunct_tokenize(sentence) for sentence in sentences])
+        with stage('lemmatize'):
+            sentences = _join_sentences(_lemmatize_sentences(tagged), as_sentences=True)
+    with stage('tokenize'):
+        batch_tokens = [apply_filters(sentence, filters) for sentence in sentences]
+    if stem:
+        with stage('stem'):
+            stemmer = load_nltk().PorterStemmer()
+            batch_tokens = [[stemmer.stem(word) for word in tokens] for tokens in batch_tokens]
+    if phrases is not False and phrases is not None:
+        with stage('phrases'):
+            batch_tokens = [list(tokens) for tokens in phrases[batch_tokens]]
+    count('sentences', len(batch_tokens))
+    return [" ".join(tokens) for tokens in batch_tokens]
 
 
 def _tokenize(text, as_sentences=False):
-    sentences = sent_tokenize(text)
-
-    def tokenize_sentence(sent):
-        return [_lemmatize(token, tag) for token, tag in pos_tag(wordpunct_tokenize(sent))]
-
-    sentence_tokens = map(tokenize_sentence, sentences)
-
+    nltk = load_nltk()
+    with stage('sent_tokenize'):
+        sentences = [nltk.wordpunct_tokenize(sent) for sent in nltk.sent_tokenize(text)]
+    with stage('pos_tag'):
+        tagged = [nltk.pos_tag(sent) for sent in sentences]
+    with stage('lemmatize'):
+        sentence_tokens = _lemmatize_sentences(tagged)
+    return _join_sentences(sentence_tokens, as_sentences)
+
+
+def _tokenize_many(texts, as_sentences=False, batch_size=Config.POS_BATCH_SIZE):
+    """
+    Batched _tokenize
+
+    Sentences from up to `batch_size` documents are POS tagged in a single pos_tag_sents call and split back
+    per document, so the tagger is set up once per batch instead of once per sentence.
+    :param texts: iterable of documents
+    :return: generator yielding the same value _tokenize would for each document, in order
+    """
+    nltk = load_nltk()
+    texts = iter(texts)
+    while True:
+        batch = list(islice(texts, batch_size))
+        if not batch:
+            return
+        with stage('sent_tokenize'):
+            doc_sentences = [[nltk.wordpunct_tokenize(sent) for sent in nltk.sent_tokenize(text)] for text in batch]
+        with stage('pos_tag'):
+            tagged = iter(nltk.pos_tag_sents([sent for sentences in doc_sentences for sent in sentences]))
+        with stage('lemmatize'):
+            joined = [_join_sentences(_lemmatize_sentences([next(tagged) for _ in sentences]), as_sentences)
+                      for sentences in doc_sentences]
+        yield from joined
+
+
+def _lemmatize_sentences(tagged_sentences):
+    hits, misses = LEMMA_CACHE.hits, LEMMA_CACHE.misses
+    sentence_tokens = [[_lemmatize(token, tag) for token, tag in sentence] for sentence in tagged_sentences]
+    count('lemma_cache.hits', LEMMA_CACHE.hits - hits)
+    count('lemma_cache.misses', LEMMA_CACHE.misses - misses)
+    return sentence_tokens
+
+
+def _join_sentences(sentence_tokens, as_sentences):
     if as_sentences:
         return [" ".join(sentence) for sentence in sentence_tokens]
     else:
         return " ".join([token for sentence in sentence_tokens for token in sentence])
 
 
+class LemmaCache(object):
+    """
+    Bounded memo of WordNet lemmas keyed on (token, WordNet POS)
+
+    :param maxsize: number of entries to keep, None for unbounded
+    :param policy: 'lru' evicts the least recently used entry, 'fifo' the oldest inserted
+    """
+
+    POLICIES = ('lru', 'fifo')
+
+    def __init__(self, maxsize=Config.LEMMA_CACHE_SIZE, policy=Config.LEMMA_CACHE_POLICY):
+        self.lemmatizer = None  # WordNet is only loaded on the first miss
+        self._entries = OrderedDict()
+        self.configure(maxsize, policy)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, maxsize, policy):
+        if policy not in self.POLICIES:
+            raise ValueError("Unknown eviction policy {}, expected one of {}".format(policy, self.POLICIES))
+        self.maxsize = maxsize
+        self.policy = policy
+        self._evict()
+
+    def lemmatize(self, token, pos):
+        key = (token, pos)
+        try:
+            lemma = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            if self.lemmatizer is None:
+                self.lemmatizer = load_nltk().WordNetLemmatizer()
+            lemma = self.lemmatizer.lemmatize(token, pos)
+            self._entries[key] = lemma
+            self._evict()
+            return lemma
+        self.hits += 1
+        if self.policy == 'lru':
+            self._entries.move_to_end(key)
+        return lemma
+
+    def _evict(self):
+        if self.maxsize is None:
+            return
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self._entries),
+                'maxsize': self.maxsize, 'policy': self.policy,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+
+NOUN, VERB, ADV, ADJ = 'n', 'v', 'r', 'a'  # nltk.corpus.reader.wordnet POS constants
+WN_POS = {'N': NOUN, 'V': VERB, 'R': ADV, 'J': ADJ}
+LEMMA_CACHE = LemmaCache()
+
+
 def _lemmatize(token, tag):
-    tag = {
-        'N': wn.NOUN,
-        'V': wn.VERB,
-        'R': wn.ADV,
-        'J': wn.ADJ
-    }.get(tag[0], wn.NOUN)
+    return LEMMA_CACHE.lemmatize(token, WN_POS.get(tag[0], NOUN))
+
+
+class CachedCleaningMixin(object):
+    """
+    Looks up cleaned output in the token cache before running the pipeline
+    """
+    cache_output = 'tokens'
 
-    return WordNetLemmatizer().lemmatize(token, tag)
+    @property
+    def token_cache(self):
+        return get_token_cache()
 
+    @property
+    def cache_fingerprint(self):
+        if getattr(self, '_cache_fingerprint', None) is None:
+            self._cache_fingerprint = cleaning_fingerprint(self.cache_output, self.stem, self.lemma, self.phrases,
+                                                           TOKENIZER.stopwords, TOKENIZER.min_length)
+        return self._cache_fingerprint
 
-class WordCleanerMixin(object):
+
+class WordCleanerMixin(CachedCleaningMixin):
 
     def __init__(self, stem, lemma, phrases=False):
         self.lemma = lemma
         self.stem = stem
         self.phrases = self.load_phraser(phrases)
+        self.lemma_cache = LEMMA_CACHE
 
     @staticmethod
     def load_phraser(use_phrases):
         if use_phrases:
-            return Phraser.load(Config.PHRASER_PATH)
+            return REGISTRY.get('compiled_phraser')
         else:
             return False
 
     def clean(self, doc):
-        return preprocess_string(doc, filters=FILTERS, lemma=self.lemma, stem=self.stem, phrases=self.phrases)
+        if isinstance(doc, (list, tuple)):
+            return list(self.clean_many(doc))
+        cache = self.token_cache
+        if cache is None:
+            return self._clean(doc)
+        return cache.clean(doc, self.cache_fingerprint, self._clean)
+
+    def clean_many(self, docs):
+        cache = self.token_cache
+        if cache is None:
+            return self._clean_many(docs)
+        return cache.clean_many(docs, self.cache_fingerprint, self._clean_many)
+
+    def _clean(self, doc):
+        return preprocess_string(doc, filters=TOKENIZER, lemma=self.lemma, stem=self.stem, phrases=self.phrases)
 
+    def _clean_many(self, docs):
+        return preprocess_documents(docs, filters=TOKENIZER, lemma=self.lemma, stem=self.stem, phrases=self.phrases)
+
+
+class SentenceCleanerMixin(CachedCleaningMixin):
+    cache_output = 'sentences'
 
-class SentenceCleanerMixin(object):
     def __init__(self, stem, lemma, phrases=False):
         self.lemma = lemma
         self.stem = stem
-        self.phrases = phrases
+        self.phrases = self.load_phraser(phrases)
+        self.lemma_cache = LEMMA_CACHE
 
     @staticmethod
     def load_phraser(use_phrases):
         if use_phrases:
-            return Phraser.load(Config.PHRASER_PATH)
+            return REGISTRY.get('compiled_phraser')
         else:
             return False
 
     def clean(self, doc):
-        return preprocess_string_to_sentences(doc, filters=FILTERS, lemma=self.lemma, stem=self.stem, phrases=self.phrases)
\ No newline at end of file
+        cache = self.token_cache
+        if cache is None:
+            return self._clean(doc)
+        return cache.clean(doc, self.cache_fingerprint, self._clean)
+
+    def iter_clean(self, text):
+        """
+        Cleaned sentences of text as they are found, for text too large to hold, e.g. an open file. Not cached
+        """
+        return iter_clean_sentences(text, filters=TOKENIZER, lemma=self.lemma, stem=self.stem, phrases=self.phrases)
+
+    def _clean(self, doc):
+        return preprocess_string_to_sentences(doc, filters=TOKENIZER, lemma=self.lemma, stem=self.stem,
+                                              phrases=self.phrases)
@@ -0,0 +1,292 @@
+import heapq
+import os
+import re
+import tempfile
+import uuid
+import weakref
+from itertools import groupby
+from operator import itemgetter
+
+from app_config import Config
+from .counting import ArrayTermStatistics, TermStatistics
+from .instrument import count, stage
+
+SHARD_SUFFIX = '.tsv'
+SHARD_HEADER = '#wordscan-shard\t1\tn_docs\t{}\n'
+TERM_BYTES = 160  # Rough memory of one term in ArrayTermStatistics: the str, its dict and list slots, two int64s
+_ESCAPED = re.compile(r'\\(.)')
+_UNESCAPE = {'t': '\t', 'n': '\n', 'r': '\r'}
+
+
+def _escape(term):
+    return term.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def _unescape(term):
+    if '\\' not in term:
+        return term
+    return _ESCAPED.sub(lambda m: _UNESCAPE.get(m.group(1), m.group(1)), term)
+
+
+def shard_paths(paths):
+    """
+    :param paths: shard files, or directories whose shard files are taken in sorted order
+    :return: list of shard file paths
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(os.path.join(path, f) for f in sorted(os.listdir(path)) if f.endswith(SHARD_SUFFIX))
+        else:
+            found.append(path)
+    return found
+
+
+def read_shard_docs(path):
+    """
+    :return: number of documents counted in the shard, from its header
+    """
+    with open(path, 'r', encoding='utf-8', newline='\n') as f:
+        header = f.readline().rstrip('\n').split('\t')
+    if len(header) != 4 or header[0] != '#wordscan-shard' or header[2] != 'n_docs':
+        raise ValueError("{} is not a wordscan shard".format(path))
+    return int(header[3])
+
+
+def iter_shard(path):
+    """
+    :return: generator of (escaped term, count, df) rows, in the shard's sorted term order
+    """
+    with open(path, 'r', encoding='utf-8', newline='\n') as f:
+        f.readline()
+        for line in f:
+            term, term_count, df = line.rstrip('\n').split('\t')
+            yield term, int(term_count), int(df)
+
+
+def merge_shards(paths):
+    """
+    k-way merge of sorted shards, summing the rows of each term
+
+    Reads one row per shard at a time, so memory does not grow with the shards' size.
+    :return: generator of (term, count, df), in sorted order of the escaped terms
+    """
+    merged = heapq.merge(*(iter_shard(path) for path in paths), key=itemgetter(0))
+    for term, rows in groupby(merged, key=itemgetter(0)):
+        term_count = df = 0
+        for _, row_count, row_df in rows:
+            term_count += row_count
+            df += row_df
+        yield _unescape(term), term_count, df
+
+
+def write_shard(path, rows, n_docs):
+    """
+    Writes rows of (term, count, df) sorted by escaped term, going through a temporary name so a shard is never
+    seen half written
+    """
+    partial = path + '.partial'
+    with open(partial, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(SHARD_HEADER.format(n_docs))
+        for term, term_count, df in rows:
+            f.write("{}\t{}\t{}\n".format(term, term_count, df))
+    os.replace(partial, path)
+    return path
+
+
+def _remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class ShardCounts(object):
+    """
+    Read-only Counter-like view of one column of ShardedTermStatistics
+
+    most_common streams the shards once. Lookups and iteration also stream them, so they cost a full merge each.
+    """
+
+    def __init__(self, stats, by):
+        self.stats = stats
+        self.by = by
+        self._column = 1 if by == 'count' else 2
+
+    def most_common(self, n=None):
+        return [(row[0], row[self._column]) for row in self.stats.top_rows(n, by=self.by)]
+
+    def items(self):
+        column = self._column
+        return [(row[0], row[column]) for row in self.stats.iter_rows() if row[column]]
+
+    def get(self, term, default=None):
+        for row in self.stats.iter_rows():
+            if row[0] == term:
+                return row[self._column] or default
+        return default
+
+    def __getitem__(self, term):
+        return self.get(term, 0)
+
+    def __contains__(self, term):
+        return self.get(term) is not None
+
+    def __iter__(self):
+        return iter([term for term, _ in self.items()])
+
+    def __len__(self):
+        return len(self.items())
+
+
+class ShardedTermStatistics(TermStatistics):
+    """
+    Exact TermStatistics for corpora larger than memory, spilled to sorted on-disk shards
+
+    Counts accumulate in an ArrayTermStatistics until its estimated size passes memory_bytes, then are written to a
+    shard of (term, count, df) rows sorted by term, with the number of documents in the header, and counting starts
+    over. Ranking k-way merges every shard, so memory holds one row per shard plus the top n. Rows come out of the
+    merge in term order, so tied terms rank in term order, where ArrayTermStatistics keeps first-seen order.
+    Shards from other processes or hosts are added with add_shards, or adopted from a worker's statistics by merge.
+    Shards spilled to a temporary directory are deleted along with the statistics, shards written to a given
+    shard_dir are kept so they can be merged elsewhere.
+    :param shard_dir: directory for spilled shards, defaults to Config.SHARD_DIR
+    :param memory_bytes: estimated in-memory budget before spilling, defaults to Config.SHARD_MEMORY_BYTES
+    """
+
+    def __init__(self, shard_dir=None, memory_bytes=None):
+        shard_dir = shard_dir or Config.SHARD_DIR
+        self.keep = shard_dir is not None
+        self.shard_dir = shard_dir or os.path.join(tempfile.gettempdir(), 'wordscan-shards')
+        self.memory_bytes = memory_bytes or Config.SHARD_MEMORY_BYTES
+        self.shards = []
+        self.n_docs = 0
+        self._buffer = ArrayTermStatistics()
+        self._owned = []  # Shards this instance spilled or adopted, and deletes unless kept
+        self._finalizer = None if self.keep else weakref.finalize(self, _remove_files, self._owned)
+
+    def _buffer_bytes(self):
+        return len(self._buffer.vocab) * TERM_BYTES
+
+    def add_document(self, tokens):
+        self._buffer.add_document(tokens)
+        self.n_docs += 1
+        if self._buffer_bytes() > self.memory_bytes:
+            self.spill()
+
+    def spill(self):
+        """
+        Writes the in-memory counts to a new shard
+        :return: the shard's path, None when there was nothing to write
+        """
+        buffer = self._buffer
+        if not buffer.n_docs:
+            return None
+        with stage('shards.spill'):
+            os.makedirs(self.shard_dir, exist_ok=True)
+            size = len(buffer.vocab)
+            counts, doc_freq = buffer.counts.values[:size].tolist(), buffer.doc_freq.values[:size].tolist()
+            rows = sorted(zip(map(_escape, buffer.vocab.id2token), counts, doc_freq))
+            name = 'shard-{}-{}{}'.format(os.getpid(), uuid.uuid4().hex, SHARD_SUFFIX)
+            path = write_shard(os.path.join(self.shard_dir, name), (row for row in rows if row[1]), buffer.n_docs)
+        count('shards.spilled')
+        self._adopt([path])
+        self._buffer = ArrayTermStatistics()
+        return path
+
+    def _adopt(self, paths):
+        self.shards.extend(paths)
+        self._owned.extend(paths)
+
+    def add_shards(self, paths):
+        """
+        Adds shards written elsewhere, e.g. by another host. They are read, never deleted.
+        :param paths: shard files or directories of them
+        """
+        paths = shard_paths(paths)
+        for path in paths:
+            self.n_docs += read_shard_docs(path)
+        self.shards.extend(paths)
+        return self
+
+    def merge(self, other):
+        # Shards are merged lazily, only other's in-memory counts are added here
+        self._adopt(other.shards)
+        other._owned[:] = []
+        self._buffer.merge(other._buffer)
+        self.n_docs += other.n_docs
+        if self._buffer_bytes() > self.memory_bytes:
+            self.spill()
+        return self
+
+    def iter_rows(self):
+        """
+        :return: generator of every (term, count, df), merged across shards
+        """
+        self.spill()
+        with stage('shards.merge'):
+            for row in merge_shards(self.shards):
+                yield row
+
+    def top_rows(self, n=None, by='count'):
+        """
+        :return: list of (term, count, df) ranked by count or df, ties in the sorted order of the escaped terms
+        rather than the order they were first seen in
+        """
+        if by not in self.METRICS:
+            raise ValueError("Unknown metric {}, expected one of {}".format(by, self.METRICS))
+        key = itemgetter(1 if by == 'count' else 2)
+        if n is None:
+            return sorted(self.iter_rows(), key=key, reverse=True)
+        return heapq.nlargest(n, self.iter_rows(), key=key)
+
+    def top(self, n=None, by='count'):
+        n_docs = self.n_docs or 1
+        return [(term, term_count, df / n_docs) for term, term_count, df in self.top_rows(n, by)]
+
+    def compact(self, path=None):
+        """
+        Merges every shard into one, e.g. to hand a run's counts to another host
+        :param path: where to write it, by default a new shard in shard_dir
+        :return: the merged shard's path
+        """
+        self.spill()
+        owned = path is None
+        if owned:
+            os.makedirs(self.shard_dir, exist_ok=True)
+            path = os.path.join(self.shard_dir, 'merged-{}{}'.format(uuid.uuid4().hex, SHARD_SUFFIX))
+        with stage('shards.compact'):
+            write_shard(path, ((_escape(term), term_count, df) for term, term_count, df in merge_shards(self.shards)),
+                        self.n_docs)
+        merged = [shard for shard in self.shards if shard in self._owned]
+        self.shards, self._owned[:] = [path], [path] if owned else []
+        _remove_files(merged)
+        return path
+
+    @property
+    def counts(self):
+        return ShardCounts(self, 'count')
+
+    @property
+    def doc_freq(self):
+        return ShardCounts(self, 'df')
+
+    def df_ratio(self, term):
+        if not self.n_docs:
+            return 0.0
+        return self.doc_freq.get(term, 0) / self.n_docs
+
+    def __getstate__(self):
+        # Sent from a worker to the parent, which takes over deleting the shards
+        if self._finalizer is not None:
+            self._finalizer.detach()
+        state = dict(self.__dict__)
+        del state['_finalizer']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._finalizer = None if self.keep else weakref.finalize(self, _remove_files, self._owned)
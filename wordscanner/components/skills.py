@@ -0,0 +1,155 @@
+import os
+import pickle
+import re
+from collections import Counter, deque
+
+SKILL_TOKEN_SPLIT = re.compile(r"[\s_]+")
+
+
+def skill_tokens(text):
+    """
+    Splits a cleaned (possibly phrased) token into words: "machine_learning" -> ("machine", "learning")
+    """
+    return tuple(token for token in SKILL_TOKEN_SPLIT.split(text.lower()) if token)
+
+
+def clean_skill(skill):
+    """
+    Words of a skill name as the document cleaner produces them, so "Ruby on Rails" -> ("ruby", "rails")
+    """
+    from .preprocessing import TOKENIZER
+    return tuple(TOKENIZER.tokenize(skill))
+
+
+class SkillMatcher(object):
+    """
+    Token-level Aho-Corasick automaton over a skills table
+
+    Finds every single and multi-word skill in one left to right pass over a document's tokens, at a cost per token
+    that does not depend on the number of skills. Phrased tokens such as "machine_learning" are matched word by
+    word, so "machine learning", "machine" and "learning" are all found in them.
+    Skill names go through the same cleaning as documents, dropping stopwords, short tokens, digits and punctuation,
+    so "ruby on rails" matches the cleaned "ruby rails". Skills that clean to nothing, such as "c++" or "r", can never
+    match and are listed in `unmatchable`. Skills whose cleaned words would match another skill's mentions are left
+    out and listed in `ambiguous` rather than counted as phantom matches: names of several words that clean to one,
+    e.g. "System Design" to "design", and skills cleaning to the same words as an earlier skill that kept all its
+    words.
+    :param skills_counts: dict of skill name -> occurrence count
+    :param normalize: function of a skill name returning its tuple of cleaned words
+    """
+
+    FORMAT_VERSION = 3
+
+    def __init__(self, skills_counts, normalize=clean_skill):
+        self.counts = dict(skills_counts)
+        self.skills = []
+        self.unmatchable = []
+        self.ambiguous = []
+        self.goto = [{}]
+        self.outputs = {}
+        for skill, tokens in self._keys(normalize):
+            state = 0
+            for token in tokens:
+                next_state = self.goto[state].get(token)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][token] = next_state
+                    self.goto.append({})
+                state = next_state
+            self.outputs.setdefault(state, []).append(len(self.skills))
+            self.skills.append(skill)
+        self.fail = self._build_fail()
+
+    def _keys(self, normalize):
+        """
+        :return: list of (skill, cleaned words) to match, sorting the others into unmatchable and ambiguous
+        """
+        keys, owners = [], {}
+        for skill in self.counts:
+            tokens = normalize(skill)
+            if not tokens:
+                self.unmatchable.append(skill)
+            elif len(tokens) == 1 and len(skill.split()) > 1:
+                self.ambiguous.append(skill)
+            else:
+                owners.setdefault(tokens, []).append(skill)
+                keys.append((skill, tokens))
+        owner = {}
+        for tokens, skills in owners.items():
+            # A shared key goes to the first skill that lost no words in cleaning, if any, the others are ambiguous
+            whole = [skill for skill in skills if len(skill.split()) == len(tokens)]
+            owner[tokens] = skills[0] if len(skills) == 1 else (whole[0] if whole else None)
+        matched = []
+        for skill, tokens in keys:
+            if owner[tokens] == skill:
+                matched.append((skill, tokens))
+            else:
+                self.ambiguous.append(skill)
+        return matched
+
+    def _build_fail(self):
+        fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and token not in self.goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = self.goto[fallback].get(token, 0) if state else 0
+                inherited = self.outputs.get(fail[next_state])
+                if inherited:
+                    self.outputs[next_state] = self.outputs.get(next_state, []) + inherited
+        self.outputs = {state: tuple(outputs) for state, outputs in self.outputs.items()}
+        return fail
+
+    def iter_matches(self, tokens):
+        goto, fail, outputs, skills = self.goto, self.fail, self.outputs, self.skills
+        state = 0
+        for token in tokens:
+            for word in (skill_tokens(token) if '_' in token else (token,)):
+                while state and word not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(word, 0)
+                if state in outputs:
+                    for index in outputs[state]:
+                        yield skills[index]
+
+    def count(self, tokens):
+        return Counter(self.iter_matches(tokens))
+
+    def __call__(self, tokens):
+        return list(self.iter_matches(tokens))
+
+    @property
+    def skills_set(self):
+        return frozenset(self.skills)
+
+    def save(self, path, source_signature=None):
+        state = {'version': self.FORMAT_VERSION, 'source': source_signature, 'counts': self.counts,
+                 'skills': self.skills, 'unmatchable': self.unmatchable, 'ambiguous': self.ambiguous, 'goto': self.goto, 'fail': self.fail,
+                 'outputs': self.outputs}
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, source_signature=None):
+        """
+        :return: SkillMatcher, or None if the file is from another format version or source
+        """
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        if state.get('version') != cls.FORMAT_VERSION or state.get('source') != source_signature:
+            return None
+        matcher = cls.__new__(cls)
+        for attr in ('counts', 'skills', 'unmatchable', 'ambiguous', 'goto', 'fail', 'outputs'):
+            setattr(matcher, attr, state[attr])
+        return matcher
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
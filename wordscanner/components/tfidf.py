@@ -0,0 +1,126 @@
+from app_config import Config
+from .instrument import stage
+from .parallel import chunked
+from .vocab import top_indices
+
+
+class TfidfScorer(object):
+    """
+    Weights cleaned documents with a precomputed gensim TfidfModel
+
+    Documents are vectorized a batch at a time into a sparse term count matrix, weighted by the model's IDFs and L2
+    normalized per document, the same weighting as model[bow] with the default TfidfModel settings. Tokens the
+    model has no ID for are ignored.
+    :param model: TfidfModel whose id2word is a gensim Dictionary
+    """
+
+    def __init__(self, model):
+        if model.id2word is None or not hasattr(model.id2word, 'token2id'):
+            raise ValueError("TF-IDF model has no dictionary to map tokens to IDs")
+        import numpy as np
+        self.token2id = model.id2word.token2id
+        self.idf = np.zeros(max(max(self.token2id.values(), default=-1), max(model.idfs, default=-1)) + 1,
+                            dtype=np.float64)
+        term_ids = np.fromiter(model.idfs.keys(), dtype=np.int64, count=len(model.idfs))
+        self.idf[term_ids] = np.fromiter(model.idfs.values(), dtype=np.float64, count=len(model.idfs))
+        self.id2token = np.empty(len(self.idf), dtype=object)
+        for token, term_id in self.token2id.items():
+            self.id2token[term_id] = token
+
+    def vectorize(self, docs):
+        """
+        :param docs: list of token lists
+        :return: scipy CSR matrix of term counts, one row per document
+        """
+        import numpy as np
+        from scipy.sparse import csr_matrix
+        token2id = self.token2id
+        indices, indptr = [], [0]
+        for tokens in docs:
+            indices.extend(term_id for term_id in map(token2id.get, tokens) if term_id is not None)
+            indptr.append(len(indices))
+        counts = csr_matrix((np.ones(len(indices), dtype=np.float64), np.asarray(indices, dtype=np.int64), indptr),
+                            shape=(len(docs), len(self.idf)))
+        counts.sum_duplicates()
+        return counts
+
+    def weigh(self, counts):
+        """
+        :return: CSR matrix of L2 normalized TF-IDF weights
+        """
+        import numpy as np
+        from scipy.sparse import diags
+        weights = counts.copy()
+        weights.data *= self.idf[weights.indices]
+        norms = np.sqrt(np.asarray(weights.multiply(weights).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        weights = diags(1.0 / norms).dot(weights).tocsr()
+        weights.sort_indices()  # The product's rows can come out of term ID order, which ties are ranked in
+        return weights
+
+    def transform(self, docs):
+        with stage('tfidf.vectorize'):
+            counts = self.vectorize(docs)
+        with stage('tfidf.weigh'):
+            return self.weigh(counts)
+
+    def top_terms(self, weights, topn=None):
+        """
+        :param weights: CSR matrix from transform
+        :return: generator of [(term, weight)] for each row, highest first, ties in term ID order as gensim lists them
+        """
+        for row in range(weights.shape[0]):
+            start, end = weights.indptr[row], weights.indptr[row + 1]
+            data, indices = weights.data[start:end], weights.indices[start:end]
+            top = top_indices(data, topn)
+            yield list(zip(self.id2token[indices[top]].tolist(), data[top].tolist()))
+
+
+class TfidfStatistics(object):
+    """
+    Sum of each term's normalized TF-IDF weight over documents, ranking the corpus by mean weight
+    """
+
+    def __init__(self, scorer):
+        import numpy as np
+        self.scorer = scorer
+        self.totals = np.zeros(len(scorer.idf), dtype=np.float64)
+        self.n_docs = 0
+
+    def add(self, weights):
+        import numpy as np
+        self.totals += np.bincount(weights.indices, weights.data, minlength=len(self.totals))
+        self.n_docs += weights.shape[0]
+
+    def top(self, n=None):
+        """
+        :return: [(term, mean weight)], highest first
+        """
+        import numpy as np
+        if not self.n_docs:
+            return []
+        scored = np.flatnonzero(self.totals)
+        top = scored[top_indices(self.totals[scored], n)]
+        return list(zip(self.scorer.id2token[top].tolist(), (self.totals[top] / self.n_docs).tolist()))
+
+
+def score_documents(scorer, token_streams, topn=None, batch_size=Config.TFIDF_BATCH_SIZE):
+    """
+    :param token_streams: iterable of each document's tokens
+    :return: generator of each document's top [(term, weight)]
+    """
+    for batch in chunked(token_streams, batch_size):
+        weights = scorer.transform(batch)
+        with stage('tfidf.top'):
+            rankings = list(scorer.top_terms(weights, topn))
+        yield from rankings
+
+
+def score_corpus(scorer, token_streams, batch_size=Config.TFIDF_BATCH_SIZE):
+    """
+    :return: TfidfStatistics of every document in token_streams
+    """
+    stats = TfidfStatistics(scorer)
+    for batch in chunked(token_streams, batch_size):
+        stats.add(scorer.transform(batch))
+    return stats
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import threading
+import zlib
+from itertools import islice
+
+from app_config import Config
+from .diskcache import DiskCache
+from .instrument import count, stage
+
+# Bump whenever a change to the cleaning code changes its output, so tokens cached by older versions are not reused
+PIPELINE_VERSION = 1
+
+_file_digests = {}
+
+
+def file_digest(path):
+    """
+    SHA-1 of a file's contents, computed once per process for each (path, size, mtime)
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _file_digests:
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        _file_digests[key] = digest.hexdigest()
+    return _file_digests[key]
+
+
+def cleaning_fingerprint(output, stem, lemma, phrases, stopwords, min_length, phraser_path=Config.PHRASER_PATH):
+    """
+    Digest of everything that determines the cleaned tokens of a document besides its text
+
+    :param output: 'tokens' or 'sentences'
+    :param stopwords: the stopword set in use, so editing STOPWORDS invalidates cached tokens
+    :param phrases: flag or loaded Phraser; when in use the model file's contents are part of the fingerprint
+    """
+    use_phrases = phrases is not None and phrases is not False
+    parts = {'version': PIPELINE_VERSION, 'output': output, 'stem': bool(stem), 'lemma': bool(lemma),
+             'min_length': min_length, 'stopwords': hashlib.sha1("\n".join(sorted(stopwords)).encode('utf-8')).hexdigest(),
+             'phraser': file_digest(phraser_path) if use_phrases else None}
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class TokenCache(object):
+    """
+    Content-addressed cache of cleaned documents
+
+    Keys are a hash of the cleaning fingerprint and the document text, values zlib-compressed JSON token lists, so
+    a document is only ever cleaned once per configuration. Size-bounded, evicting the least recently used.
+    """
+
+    def __init__(self, path=Config.TOKEN_CACHE_PATH, max_bytes=Config.TOKEN_CACHE_MAX_BYTES):
+        self.store = DiskCache(path, max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text, fingerprint):
+        digest = hashlib.sha1(fingerprint.encode('ascii'))
+        digest.update(text.encode('utf-8', 'surrogatepass'))
+        return digest.hexdigest()
+
+    @staticmethod
+    def _encode(tokens):
+        return zlib.compress(json.dumps(tokens, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+    @staticmethod
+    def _decode(value):
+        return json.loads(zlib.decompress(value).decode('utf-8'))
+
+    def clean(self, text, fingerprint, clean):
+        """
+        :param clean: function of text returning its tokens, called on a miss
+        """
+        return next(self.clean_many([text], fingerprint, lambda texts: [clean(t) for t in texts]))
+
+    def clean_many(self, texts, fingerprint, clean_batch, batch_size=Config.POS_BATCH_SIZE):
+        """
+        :param clean_batch: function of a list of texts returning their tokens in order, called with the misses
+        :return: generator of tokens for each text, in order
+        """
+        texts = iter(texts)
+        while True:
+            batch = list(islice(texts, batch_size))
+            if not batch:
+                return
+            with stage('token_cache.lookup'):
+                keys = [self.key(text, fingerprint) for text in batch]
+                found = self.store.get_many(keys)
+                results = [self._decode(found[key]) if key in found else None for key in keys]
+            misses = [i for i, key in enumerate(keys) if key not in found]
+            self.hits += len(batch) - len(misses)
+            self.misses += len(misses)
+            count('token_cache.hits', len(batch) - len(misses))
+            count('token_cache.misses', len(misses))
+            if misses:
+                cleaned = list(clean_batch([batch[i] for i in misses]))
+                new_entries = {}
+                for i, tokens in zip(misses, cleaned):
+                    results[i] = tokens
+                    new_entries[keys[i]] = self._encode(tokens)
+                with stage('token_cache.store'):
+                    self.store.put_many(new_entries.items())
+            for tokens in results:
+                yield tokens
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.store.evictions,
+                'write_errors': self.store.write_errors, 'entries': len(self.store), 'bytes': self.store.total_bytes(),
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+
+_token_cache = None
+_token_cache_pid = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache():
+    """
+    The TokenCache for this process, or None when Config.TOKEN_CACHE_ENABLED is off
+
+    Forked cleaning workers open their own rather than sharing the parent's SQLite connection.
+    """
+    global _token_cache, _token_cache_pid
+    if not Config.TOKEN_CACHE_ENABLED:
+        return None
+    with _token_cache_lock:
+        if _token_cache is None or _token_cache_pid != os.getpid():
+            _token_cache = TokenCache()
+            _token_cache_pid = os.getpid()
+    return _token_cache
@@ -0,0 +1,156 @@
+from array import array
+
+
+def top_indices(values, n=None):
+    """
+    Indices of the n largest values, largest first, ties in index order as heapq.nlargest would give them
+
+    Sorts with mergesort, the stable kind every NumPy version has (kind='stable' needs NumPy 1.15).
+
+    :param values: 1-d NumPy array
+    :param n: number of indices, None for all
+    """
+    import numpy as np
+    if n is None or n >= len(values):
+        return np.argsort(-values, kind='mergesort')
+    if n <= 0:
+        return np.zeros(0, dtype=np.int64)
+    # Everything tied with the n-th largest value is a candidate, so the cut is made in index order
+    threshold = values[np.argpartition(-values, n - 1)[n - 1]]
+    candidates = np.flatnonzero(values >= threshold)
+    return candidates[np.argsort(-values[candidates], kind='mergesort')][:n]
+
+
+class Vocabulary(object):
+    """
+    Interns tokens to consecutive int32 IDs, in the order they are first seen
+    """
+
+    def __init__(self, tokens=()):
+        self.token2id = {}
+        self.id2token = []
+        self.encode(tokens)
+
+    def add(self, token):
+        token_id = self.token2id.get(token)
+        if token_id is None:
+            token_id = self.token2id[token] = len(self.id2token)
+            self.id2token.append(token)
+        return token_id
+
+    def encode(self, tokens):
+        """
+        :return: list of the tokens' IDs, interning unseen tokens
+        """
+        ids = list(map(self.token2id.get, tokens))
+        if None in ids:
+            ids = [self.add(token) if token_id is None else token_id for token, token_id in zip(tokens, ids)]
+        return ids
+
+    def decode(self, ids):
+        id2token = self.id2token
+        return [id2token[token_id] for token_id in ids]
+
+    def remap(self, other):
+        """
+        Interns other's tokens
+
+        :return: int64 array mapping each of other's IDs to this vocabulary's ID for the same token
+        """
+        import numpy as np
+        return np.asarray(self.encode(other.id2token), dtype=np.int64)
+
+    def get(self, token, default=None):
+        return self.token2id.get(token, default)
+
+    def __getitem__(self, token_id):
+        return self.id2token[token_id]
+
+    def __contains__(self, token):
+        return token in self.token2id
+
+    def __len__(self):
+        return len(self.id2token)
+
+    def __getstate__(self):
+        # token2id is rebuilt on load, halving what workers send back
+        return {'id2token': self.id2token}
+
+    def __setstate__(self, state):
+        self.id2token = state['id2token']
+        self.token2id = {token: token_id for token_id, token in enumerate(self.id2token)}
+
+
+class TokenCorpus(object):
+    """
+    Cleaned documents as token IDs in one flat int32 buffer, with each document's start in an offsets buffer
+
+    About 4 bytes per token instead of a str reference and a list slot, and the buffers are viewed as NumPy arrays
+    without copying.
+    :param vocab: Vocabulary to intern tokens in, shared between corpora to compare IDs directly
+    """
+
+    def __init__(self, vocab=None):
+        self.vocab = vocab if vocab is not None else Vocabulary()
+        self._ids = array('i')
+        self._offsets = array('q', [0])
+
+    def add_document(self, tokens):
+        self._ids.fromlist(self.vocab.encode(tokens))
+        self._offsets.append(len(self._ids))
+
+    def extend(self, docs):
+        for tokens in docs:
+            self.add_document(tokens)
+
+    @property
+    def ids(self):
+        import numpy as np
+        return np.frombuffer(self._ids, dtype=np.int32) if self._ids else np.zeros(0, dtype=np.int32)
+
+    @property
+    def offsets(self):
+        import numpy as np
+        return np.frombuffer(self._offsets, dtype=np.int64)
+
+    @property
+    def n_tokens(self):
+        return len(self._ids)
+
+    def document(self, index):
+        return self.vocab.decode(self._ids[self._offsets[index]:self._offsets[index + 1]])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.document(index)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def clear(self):
+        self._ids = array('i')
+        self._offsets = array('q', [0])
+
+    def counts(self, minlength=0):
+        """
+        :return: int64 array of each token ID's occurrences
+        """
+        import numpy as np
+        return np.bincount(self.ids, minlength=max(minlength, len(self.vocab)))
+
+    def doc_freq(self, minlength=0):
+        """
+        :return: int64 array of the number of documents each token ID occurs in
+        """
+        import numpy as np
+        size = max(minlength, len(self.vocab))
+        ids = self.ids
+        if not len(ids):
+            return np.zeros(size, dtype=np.int64)
+        doc_index = np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.offsets))
+        pairs = np.sort(doc_index * size + ids)
+        # Sorted, so each distinct (document, ID) pair starts where it differs from its predecessor
+        first = np.empty(len(pairs), dtype=bool)
+        first[0] = True
+        np.not_equal(pairs[1:], pairs[:-1], out=first[1:])
+        return np.bincount(pairs[first] % size, minlength=size)
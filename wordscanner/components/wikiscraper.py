@@ -1,16 +1,175 @@
-import requests
-from bs4 import BeautifulSoup as bs
+import codecs
+import os
+import re
+from html.parser import HTMLParser
+
+from app_config import Config
+from .avature import _iter_fetch_text
+from .instrument import count, stage
+
+ARTICLE_CLASS = 'mw-parser-output'
+TEXT_ELEMENTS = ('p', 'ul')  # Children of the article body whose text is kept
+VOID_ELEMENTS = frozenset(['area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param',
+                           'source', 'track', 'wbr'])
+WIKI_SOURCES_SPLIT = re.compile(r"\s*\n\s*|,\s+")  # Not bare commas or spaces, which URLs and paths contain
+
+
+class WikiTextParser(HTMLParser):
+    """
+    Incremental extraction of the article text of a Wikipedia page
+
+    Keeps the text of each p and ul that is a direct child of the first div.mw-parser-output, the same text
+    BeautifulSoup's get_text gives for them, and nothing else is built. Feed it the page a piece at a time and
+    collect finished texts with pop_texts. Unclosed elements end at the next matching end tag above them and stray
+    end tags are ignored, as in BeautifulSoup's html.parser tree.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.texts = []
+        self._stack = None  # Open tags inside the article body, None until it starts
+        self._done = False
+        self._capture = None  # Text pieces of the p / ul being read
+        self._capture_depth = None
+
+    def handle_starttag(self, tag, attrs):
+        if self._done or tag in VOID_ELEMENTS:
+            return
+        if self._stack is None:
+            if tag == 'div' and ARTICLE_CLASS in (dict(attrs).get('class') or '').split():
+                self._stack = ['div']
+            return
+        self._stack.append(tag)
+        if self._capture is None and len(self._stack) == 2 and tag in TEXT_ELEMENTS:
+            self._capture = []
+            self._capture_depth = 2
+
+    def handle_startendtag(self, tag, attrs):
+        # <br/> and other self-closed tags open nothing
+        if tag not in VOID_ELEMENTS:
+            self.handle_starttag(tag, attrs)
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if self._done or self._stack is None or tag not in self._stack:
+            return
+        while True:
+            closed = self._stack.pop()
+            if self._capture is not None and len(self._stack) < self._capture_depth:
+                self.texts.append("".join(self._capture))
+                self._capture = None
+            if closed == tag:
+                break
+        if not self._stack:
+            self._done = True
+
+    def handle_data(self, data):
+        if self._capture is not None:
+            self._capture.append(data)
+
+    def close(self):
+        super().close()
+        # An element left open at the end of the page still counts, as BeautifulSoup closes it
+        if self._capture is not None:
+            self.texts.append("".join(self._capture))
+            self._capture = None
+
+    def pop_texts(self):
+        texts, self.texts = self.texts, []
+        return texts
+
+
+def iter_wiki_text(chunks, encoding='utf-8'):
+    """
+    :param chunks: iterable of bytes or str pieces of one page
+    :return: generator of the article's paragraph and list texts, yielded as soon as each element closes
+    """
+    parser = WikiTextParser()
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    for chunk in chunks:
+        with stage('wiki.parse'):
+            parser.feed(decoder.decode(chunk) if isinstance(chunk, bytes) else chunk)
+            texts = parser.pop_texts()
+        count('wiki.bytes', len(chunk))
+        yield from texts
+    with stage('wiki.parse'):
+        parser.feed(decoder.decode(b'', final=True))
+        parser.close()
+    yield from parser.pop_texts()
 
 
 def get_wiki_text(url):
-    page = requests.get(url)
-    soup = bs(page.content, 'html.parser')
-    elements = soup.find("div", class_="mw-parser-output").contents
-    texts = [e.get_text() for e in elements if e.name == 'p' or e.name == 'ul']
-    return texts
+    """
+    :return: generator of the article texts of url, parsed as the page downloads
+    """
+    return _iter_fetch_text(url, iter_wiki_text)
+
+
+def iter_file_chunks(path, chunk_size=Config.FETCH_CHUNK_SIZE):
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            yield chunk
+
+
+def iter_saved_pages(path):
+    """
+    :param path: a saved page, or a directory walked in sorted order for .htm / .html files
+    :return: generator of page paths
+    """
+    if not os.path.isdir(path):
+        yield path
+        return
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for fname in sorted(files):
+            if fname.lower().endswith(('.htm', '.html')):
+                yield os.path.join(root, fname)
+
+
+def parse_wiki_sources(sources):
+    """
+    :param sources: URLs and paths of saved pages or directories, as a list or one str with one source per line or
+    separated by a comma and a space
+    :return: list of sources
+    """
+    if sources is None:
+        return []
+    if isinstance(sources, str):
+        sources = WIKI_SOURCES_SPLIT.split(sources)
+    return [source.strip() for source in sources if source and source.strip()]
+
+
+def iter_wiki_texts(sources):
+    """
+    Article texts of every source, one page at a time
+
+    Saved pages are read from disk in chunks. URLs go through the response cache and are parsed as they download,
+    so texts are yielded before the page has finished.
+    :return: generator of paragraph and list texts
+    """
+    for source in parse_wiki_sources(sources):
+        if os.path.exists(source):
+            for path in iter_saved_pages(source):
+                count('wiki.pages')
+                yield from iter_wiki_text(iter_file_chunks(path))
+        else:
+            count('wiki.pages')
+            yield from get_wiki_text(source)
+
+
+class WikiTexts(object):
+    """
+    Re-iterable stream of the article texts of sources, read again on every pass
+    """
+
+    def __init__(self, sources):
+        self.sources = parse_wiki_sources(sources)
+
+    def __iter__(self):
+        return iter_wiki_texts(self.sources)
 
 
 class WikipediaMixin(object):
 
     def __init__(self, url):
-        self.text = " ".join(get_wiki_text(url))
+        self.text = WikiTexts(url)
@@ -1,29 +1,46 @@
+import multiprocessing
+import sys
 from collections import Counter
 from operator import itemgetter
 
-import easygui
-
+from app_config import Config
 from components.avature import AvatureMixin
 from components.cisco_jobs import CiscoJobsMixin
+from components.instrument import INSTRUMENTS, stage
 from components.keywords import KeywordExtractionMixin, SkillExtractionMixin
+from components.parallel import CleaningExecutor, KeywordExecutor
+from components.models import REGISTRY
 from components.preprocessing import WordCleanerMixin
-from components.ui import UserInterface
+from components.shards import ShardedTermStatistics
+from components.tfidf import score_corpus, score_documents
 from components.wikiscraper import WikipediaMixin
 
 
 class WordSearch(object):
+    """
+    Base for all modes
+
+    results() computes rows of plain values named by `columns` and never prompts, so modes can run headless when
+    their input is passed in. run() is the interactive path, prompting for anything missing and showing the rows
+    formatted with `result_format`.
+    """
+
+    columns = ()
+    result_format = ""
+    notes = ()  # Caveats about the last results, shown above them
 
     def __init__(self, multiple, stem, lemma, phrases, text=None):
         self.multiple = multiple
         self.stem = stem
         self.lemma = lemma
         self.phrases = phrases
-        if not text:
+        if text is None:
             self.text = self.prompt_text()
         else:
             self.text = text
 
     def prompt_text(self):
+        import easygui
         if not self.multiple:
             return easygui.codebox("Enter Text")
         all_text, getting_text = [], True
@@ -35,201 +52,285 @@ class WordSearch(object):
                 break
         return all_text
 
+    def results(self):
+        """
+        Override point every mode implements, computing its rows without prompting
+
+        Modes that rank terms take a topn argument as well.
+        :return: list of tuples of plain values, one per row, in the order of `columns`
+        """
+        raise NotImplementedError("{} does not implement results()".format(type(self).__name__))
+
+    def format_results(self, rows):
+        return [self.result_format.format(*row) for row in rows]
+
+    def _note_counts(self, stats, doc_freq=False):
+        """
+        :param doc_freq: document frequencies are shown or ranked on, so their error bound is noted too
+        """
+        notes = []
+        error = stats.error_bound()
+        if error:
+            notes.append("Approximate counts: each may be overstated by up to {}".format(error))
+        df_error = stats.df_error_bound() if doc_freq else 0
+        if df_error:
+            notes.append("Approximate frequencies: each may be overstated by up to {} documents ({:.2%})".format(
+                df_error, df_error / (stats.n_docs or 1)))
+        if getattr(stats, 'keep', False):
+            notes.append("Count shards kept in {}".format(stats.shard_dir))
+        self.notes = notes
+        return stats
+
     @staticmethod
     def show_results(results):
+        import easygui
         if isinstance(results, list):
             easygui.codebox(text="\n".join(results))
         else:
             easygui.codebox(text=results)
 
+    def run(self):
+        with stage('results'):
+            rows = self.results()
+        results = self.format_results(rows)
+        with stage('display'):
+            return self.show_results(list(self.notes) + results)
+
 
 class KeywordSearch(WordSearch, KeywordExtractionMixin):
 
-    def __init__(self, multiple):
-        WordSearch.__init__(self, multiple, stem=False, lemma=False, phrases=False)  # Not used with Rake
+    columns = ('score', 'phrase')
+    result_format = "{:.1f} : {}"
+
+    def __init__(self, multiple, text=None):
+        WordSearch.__init__(self, multiple, stem=False, lemma=False, phrases=False, text=text)  # Not used with Rake
         KeywordExtractionMixin.__init__(self)
 
-    def _get_keywords(self, scores=True):
+    def results(self, topn=None):
         if self.multiple:
-            all_text = " ".join(self.text)
-        else:
-            all_text = self.text
-        kw = self.extract_kw(all_text, scores)
-        if scores:
-            kw = ["{:.1f} : {}".format(score, kw) for score, kw in kw]
-        self.show_results(kw)
+            # Documents are scored separately and their statistics merged, so phrases never span two documents
+            return KeywordExecutor(self).rank(self.text, topn)
+        return self.extract_kw(self.text, scores=True)[:topn]
 
-    def run(self):
-        return self._get_keywords()
+    def document_results(self, topn=None):
+        return KeywordExecutor(self, doc_topn=topn).extract(self.text)
 
 
 class SkillSearch(WordSearch, WordCleanerMixin, SkillExtractionMixin):
 
-    def __init__(self, multiple):
-        WordSearch.__init__(self, multiple, stem=False, lemma=False, phrases=False)
+    columns = ('skill', 'count', 'occurrences')
+    result_format = "{} : {}: {}"
+
+    def __init__(self, multiple, text=None):
+        WordSearch.__init__(self, multiple, stem=False, lemma=False, phrases=False, text=text)
         WordCleanerMixin.__init__(self, self.stem, self.lemma, self.phrases)
         SkillExtractionMixin.__init__(self)
 
-    def _get_skills(self):
+    def results(self):
         if self.multiple:
-            all_text = [self.clean(doc) for doc in self.text]
-            all_text = [words for doc in all_text for words in doc]
+            stats = CleaningExecutor(self, analyzer=self.skill_matcher).count(self.text)
+            skill_counter = self._note_counts(stats).counts
         else:
-            all_text = self.clean(self.text)
-
-        skills = [token for token in all_text if token in self.skills_set]
-        skill_counter = Counter(skills)
+            self.notes = []
+            skill_counter = self.match_skills(self.clean(self.text))
+        self.notes = self.unmatchable_notes() + self.notes
+        return self._skill_rows(skill_counter)
+
+    def document_results(self):
+        for tokens in self.clean_many(self.text):
+            yield self._skill_rows(self.match_skills(tokens))
+
+    def unmatchable_notes(self):
+        notes = []
+        for skills, reason in ((self.skill_matcher.unmatchable, "clean to nothing and are never matched"),
+                               (self.skill_matcher.ambiguous, "clean to another skill's words or to one common "
+                                                              "word and are not counted")):
+            if skills:
+                shown = sorted(skills)[:20]
+                notes.append("{} skills {}: {}{}".format(len(skills), reason, ", ".join(shown),
+                                                         ", ..." if len(skills) > len(shown) else ""))
+        return notes
+
+    def _skill_rows(self, skill_counter):
         skill_data = []
         for word, count in skill_counter.most_common():
             occurence_count = self.skills_counts.get(word, 0)
             skill_data.append((word, count, occurence_count))
-        skill_data = sorted(skill_data, key=itemgetter(2), reverse=True)
-        counts = ["{} : {}: {}".format(word, count, occurence_count) for word, count, occurence_count in skill_data]
-        self.show_results(counts)
-
-    def run(self):
-        return self._get_skills()
+        return sorted(skill_data, key=itemgetter(2), reverse=True)
 
 
 class WordCounts(WordSearch, WordCleanerMixin):
 
-    def __init__(self, multiple, stem, lemma, phrases):
-        WordSearch.__init__(self, multiple, stem, lemma, phrases)
+    columns = ('word', 'count')
+    result_format = "{} : {}"
+
+    def __init__(self, multiple, stem, lemma, phrases, text=None):
+        WordSearch.__init__(self, multiple, stem, lemma, phrases, text=text)
         WordCleanerMixin.__init__(self, self.stem, self.lemma, self.phrases)
 
-    def _get_counts(self, topn=100):
+    def results(self, topn=100):
         if self.multiple:
-            all_text = [self.clean(doc) for doc in self.text]
-            all_text = [words for doc in all_text for words in doc]
+            word_counter = self._note_counts(CleaningExecutor(self).count(self.text)).counts
         else:
-            all_text = self.clean(self.text)
+            word_counter = Counter(self.clean(self.text))
+        return word_counter.most_common(n=topn)
 
-        word_counter = Counter(all_text)
-        counts = word_counter.most_common(n=topn)
-        counts = ["{} : {}".format(word, count) for word, count in counts]
-        self.show_results(counts)
+    def document_results(self, topn=100):
+        for tokens in self.clean_many(self.text):
+            yield Counter(tokens).most_common(n=topn)
 
-    def run(self):
-        return self._get_counts()
+
+class TfidfWordCounts(WordSearch, WordCleanerMixin):
+    """
+    Ranks words by TF-IDF weight from the model at Config.TFIDF_PATH instead of raw counts, so words common to every
+    document sink. The model was built from lemmatized text with phrases, clean the same way for the best coverage.
+    """
+
+    columns = ('word', 'score')
+    result_format = "{} : {:.4f}"
+
+    def __init__(self, multiple, stem, lemma, phrases, text=None):
+        WordSearch.__init__(self, multiple, stem, lemma, phrases, text=text)
+        WordCleanerMixin.__init__(self, self.stem, self.lemma, self.phrases)
+        self.scorer = REGISTRY.get('tfidf_scorer')
+
+    def _token_streams(self):
+        if self.multiple:
+            return CleaningExecutor(self).clean(self.text)
+        return [self.clean(self.text)]
+
+    def results(self, topn=100):
+        # Corpus score is each word's mean normalized weight over all documents
+        return score_corpus(self.scorer, self._token_streams()).top(topn)
+
+    def document_results(self, topn=100):
+        return score_documents(self.scorer, self._token_streams(), topn=topn)
 
 
 class WikiWordCounts(WordSearch, WordCleanerMixin, WikipediaMixin):
 
-    def __init__(self, stem, lemma, phrases):
-        self.url = self.prompt_text()
+    columns = ('word', 'count')
+    result_format = "{} : {}"
+
+    def __init__(self, stem, lemma, phrases, url=None):
+        self.url = url if url is not None else self.prompt_text()
         WikipediaMixin.__init__(self, self.url)
-        WordSearch.__init__(self, multiple=False, text=self.text, stem=stem, lemma=lemma, phrases=phrases)
+        # Paragraphs stream from the parser straight into the cleaning workers
+        WordSearch.__init__(self, multiple=True, text=self.text, stem=stem, lemma=lemma, phrases=phrases)
         WordCleanerMixin.__init__(self, self.stem, self.lemma, self.phrases)
 
     def prompt_text(self):
-        return easygui.enterbox(msg="Enter the wikipedia URL")
+        import easygui
+        return easygui.enterbox(msg="Enter Wikipedia URLs, or folders of saved article pages, one per line or separated "
+                                    "by a comma and a space")
 
-    def _get_counts(self, topn=100):
-        if self.multiple:
-            all_text = [self.clean(doc) for doc in self.text]
-            all_text = [words for doc in all_text for words in doc]
-        else:
-            all_text = self.clean(self.text)
-
-        word_counter = Counter(all_text)
-        counts = word_counter.most_common(n=topn)
-        counts = ["{} : {}".format(word, count) for word, count in counts]
-        self.show_results(counts)
-
-    def run(self):
-        return self._get_counts()
+    def results(self, topn=100):
+        word_counter = self._note_counts(CleaningExecutor(self).count(self.text)).counts
+        return word_counter.most_common(n=topn)
 
 
 class AvatureWordCounts(WordSearch, WordCleanerMixin, AvatureMixin):
 
-    def __init__(self, stem, lemma, phrases):
-        self.zip_path = self.prompt_text()
-        AvatureMixin.__init__(self, self.zip_path)
+    columns = ('word', 'count', 'frequency')
+    result_format = "{} : {} : {:.2%}"
+
+    def __init__(self, stem, lemma, phrases, zip_path=None, sort_by=None, dedup=None):
+        self.zip_path = zip_path if zip_path is not None else self.prompt_text()
+        self.sort_by = sort_by
+        AvatureMixin.__init__(self, self.zip_path, dedup=dedup)
         WordSearch.__init__(self, multiple=True, text=self.text, stem=stem, lemma=lemma, phrases=phrases)
         WordCleanerMixin.__init__(self, self.stem, self.lemma, self.phrases)
 
     def prompt_text(self):
+        import easygui
         return easygui.fileopenbox(msg="Select the zip file to extract")
 
-    def _get_counts(self, topn=100):
-        all_docs = [self.clean(doc) for doc in self.text]
-        all_text = [words for doc in all_docs for words in doc]
+    def prompt_sort(self):
+        import easygui
+        how_sort = easygui.choicebox(msg="How should we sort? By frequency or count?", choices=['Frequency', 'Count'])
+        return 'count' if how_sort == 'Count' else 'df'
 
-        # Get occurrence counts
-        all_words = set(all_text)
-        word_counter = Counter(all_text)
-        counts = word_counter.most_common(n=topn)
+    def results(self, topn=100):
+        # Frequency is the share of documents containing each word
+        stats = self._note_counts(CleaningExecutor(self).count(self.text), doc_freq=True)
+        self.notes = self.duplicate_notes() + self.notes
+        return stats.top(topn, by=self.sort_by or 'count')
 
-        word_occur = {word: 0 for word in all_words}
-        for word in all_words:
-            for doc in all_docs:
-                if word in doc:
-                    word_occur[word] = word_occur.get(word, 0) + 1
+    def run(self):
+        if self.sort_by is None:
+            self.sort_by = self.prompt_sort()
+        return WordSearch.run(self)
 
-        word_freq = {word: count/len(all_docs) for word, count in word_occur.items()}
 
-        str_counts = ["{} : {} : {:.2%}".format(word, count, word_freq.get(word, 0)) for word, count in counts]
+class ShardWordCounts(WordSearch):
+    """
+    Exact totals of count shards written by other runs, e.g. on other hosts with Config.SHARD_DIR set
+    """
 
-        how_sort = easygui.choicebox(msg="How should we sort? By frequency or count?", choices=['Frequency', 'Count'])
-        if how_sort == 'Count':
-            self.show_results(str_counts)
-        else:
-            sorted_counts = sorted(
-                [(word, count, word_freq.get(word, 0)) for word, count in counts], key=itemgetter(2), reverse=True)
-            str_counts = ["{} : {} : {:.2%}".format(word, count, word_f) for word, count, word_f in sorted_counts]
-            self.show_results(str_counts)
+    columns = ('word', 'count', 'frequency')
+    result_format = "{} : {} : {:.2%}"
 
-    def run(self):
-        return self._get_counts()
+    def __init__(self, shards=None, sort_by='count'):
+        self.sort_by = sort_by
+        WordSearch.__init__(self, multiple=True, stem=False, lemma=False, phrases=False, text=shards)
+
+    def prompt_text(self):
+        import easygui
+        return easygui.diropenbox(msg="Select the folder of count shards")
+
+    def results(self, topn=100):
+        return ShardedTermStatistics().add_shards(self.text).top(topn, by=self.sort_by)
 
 
 class CiscoJobsWordCounts(WordSearch, WordCleanerMixin, CiscoJobsMixin):
 
-    def __init__(self, stem, lemma, phrases):
-        self.req_id = self.prompt_text()
-        try:
-            CiscoJobsMixin.__init__(self, self.req_id)
-        except:
-            easygui.msgbox("That Job was not found, please try another")
-        WordSearch.__init__(self, multiple=False, text=self.text, stem=stem, lemma=lemma, phrases=phrases)
+    columns = ('word', 'count')
+    result_format = "{} : {}"
+
+    def __init__(self, stem, lemma, phrases, req_ids=None):
+        self.req_id = req_ids if req_ids is not None else self.prompt_text()
+        CiscoJobsMixin.__init__(self, self.req_id)
+        WordSearch.__init__(self, multiple=True, text=self.text, stem=stem, lemma=lemma, phrases=phrases)
         WordCleanerMixin.__init__(self, self.stem, self.lemma, self.phrases)
 
     def prompt_text(self):
-        return easygui.enterbox(msg="Enter the Req ID")
+        import easygui
+        return easygui.enterbox(msg="Enter the Req ID(s), separated by commas or spaces")
 
-    def _get_counts(self, topn=100):
-        all_text = self.clean(self.text)
-        word_counter = Counter(all_text)
-        counts = word_counter.most_common(n=topn)
-        counts = ["{} : {}".format(word, count) for word, count in counts]
-        self.show_results(counts)
+    def results(self, topn=100):
+        word_counter = self._note_counts(CleaningExecutor(self).count(self.text)).counts
+        return word_counter.most_common(n=topn)
 
     def run(self):
-        return self._get_counts()
+        if self.fetch_errors:
+            import easygui
+            easygui.msgbox(self.fetch_error_message())
+        return WordSearch.run(self)
 
 
 class CiscoJobsKeywords(WordSearch, KeywordExtractionMixin, CiscoJobsMixin):
 
-    def __init__(self, *args, **kwargs):
-        self.req_id = self.prompt_text()
-        try:
-            CiscoJobsMixin.__init__(self, self.req_id)
-        except:
-            easygui.msgbox("That Job was not found, please try another")
-        WordSearch.__init__(self, multiple=False, text=self.text, stem=False, lemma=False, phrases=False)
+    columns = ('score', 'phrase')
+    result_format = "{:.1f} : {}"
+
+    def __init__(self, *args, req_ids=None, **kwargs):
+        self.req_id = req_ids if req_ids is not None else self.prompt_text()
+        CiscoJobsMixin.__init__(self, self.req_id)
+        WordSearch.__init__(self, multiple=True, text=self.text, stem=False, lemma=False, phrases=False)
         KeywordExtractionMixin.__init__(self)
 
     def prompt_text(self):
-        return easygui.enterbox(msg="Enter the Req ID")
+        import easygui
+        return easygui.enterbox(msg="Enter the Req ID(s), separated by commas or spaces")
 
-    def _get_keywords(self, scores=True):
-        kw = self.extract_kw(self.text, scores)
-        if scores:
-            kw = ["{:.1f} : {}".format(score, kw) for score, kw in kw]
-        self.show_results(kw)
+    def results(self, topn=None):
+        return KeywordExecutor(self).rank(self.text, topn)
 
     def run(self):
-        return self._get_keywords()
+        if self.fetch_errors:
+            import easygui
+            easygui.msgbox(self.fetch_error_message())
+        return WordSearch.run(self)
 
 
 mode_map = {'Keywords': [KeywordSearch, False],
@@ -239,20 +340,32 @@ mode_map = {'Keywords': [KeywordSearch, False],
             'Skill Scan - Multiple': [SkillSearch, True],
             'Word Counts': [WordCounts, False],
             'Word Counts - Multiple': [WordCounts, True],
+            'Word Counts - TF-IDF': [TfidfWordCounts, True],
             'Word Counts - Avature Quick View': AvatureWordCounts,
             'Word Counts - Cisco Jobs': CiscoJobsWordCounts,
-            'Word Counts - Wikipedia': WikiWordCounts}
+            'Word Counts - Wikipedia': WikiWordCounts,
+            'Merge Count Shards': ShardWordCounts}
 
 secondary_options = [k for k in list(mode_map.keys()) if k.startswith('Word Counts')]
 
-running = True
-ui = UserInterface(mode_objects_map=mode_map, secondary_options=secondary_options)
-while running:
-    result = ui.prompt()
-    if not result:
-        running = False
-        break
-    result.run()
-    if not easygui.ccbox("More?"):
-        running = False
-        break
+if __name__ == '__main__':
+    import easygui
+    from components.ui import UserInterface
+
+    multiprocessing.freeze_support()  # Cleaning workers re-enter the frozen executable on Windows
+    if Config.INSTRUMENT:
+        INSTRUMENTS.enable()
+    running = True
+    ui = UserInterface(mode_objects_map=mode_map, secondary_options=secondary_options)
+    while running:
+        result = ui.prompt()
+        if not result:
+            running = False
+            break
+        result.run()
+        if INSTRUMENTS.enabled:
+            print(INSTRUMENTS.summary(), file=sys.stderr)
+            INSTRUMENTS.reset()
+        if not easygui.ccbox("More?"):
+            running = False
+            break